@@ -31,30 +31,68 @@ import fastly
 from optparse import OptionParser
 
 
+def read_urls(stream):
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
 def main():
     """
-        Purge a single fastly url
+        Purge a single fastly url, or stream urls from a file or stdin
     """
 
     parser = OptionParser(description=
-             "Purge a single url from fastly.")
+             "Purge a single url from fastly, or a list of urls (one per "
+             "line) read from a file or stdin.")
     parser.add_option("-k", "--key", dest="apikey",
                       default="", help="fastly api key")
     parser.add_option("-H", "--host", dest="host",
                       help="host to purge from")
     parser.add_option("-p", "--path", dest="path",
                       help="path to purge")
+    parser.add_option("-f", "--file", dest="filename",
+                      help="file of urls to purge, - for stdin")
+    parser.add_option("-P", "--parallelism", dest="parallelism",
+                      type="int", default=fastly.FASTLY_POOL_SIZE,
+                      help="number of purges in flight at once")
+    parser.add_option("-r", "--rate", dest="rate", type="float",
+                      default=None, help="maximum purges per second")
 
     (options, args) = parser.parse_args()
-    for val in options.__dict__.values():
-        if val is None:
-            print "Missing required options"
-            parser.print_help()
-            sys.exit(1)
-
-    client = fastly.connect(options.apikey)
-    purge = client.purge_url(options.host, options.path)
-    print purge
+    if options.filename is None and \
+            (options.host is None or options.path is None):
+        print "Missing required options"
+        parser.print_help()
+        sys.exit(1)
+
+    client = fastly.connect(options.apikey,
+                            pool_size=options.parallelism)
+
+    if options.filename is None:
+        purge = client.purge_url(options.host, options.path)
+        print purge
+        return
+
+    if options.filename == "-":
+        stream = sys.stdin
+    else:
+        stream = open(options.filename, 'r')
+
+    failed = 0
+    results = client.purge_urls(read_urls(stream),
+                                parallelism=options.parallelism,
+                                rate=options.rate)
+    for url, purge, error in results:
+        if error is not None:
+            failed += 1
+            print "%s\terror\t%s" % (url, error)
+        else:
+            print "%s\t%s\t%s" % (url, purge.status, purge.id)
+
+    if failed:
+        sys.exit(2)
 
 if __name__ == "__main__":
     main()
@@ -26,86 +26,163 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import hashlib
+import os
 import sys
 import fastly
 from optparse import OptionParser
 
 
+def read_vcls(paths):
+    """
+        Read the vcl files named by paths, expanding directories to the
+        .vcl files they contain. Returns a dict of vcl name to content.
+    """
+    vcls = {}
+    for path in paths:
+        if os.path.isdir(path):
+            filenames = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                         if f.endswith(".vcl")]
+        else:
+            filenames = [path]
+        for filename in filenames:
+            vcl_file = open(filename, 'r')
+            vcls[os.path.basename(filename)] = vcl_file.read()
+            vcl_file.close()
+    return vcls
+
+
 def main():
     """
-        Upload a vcl file to a fastly service, cloning the current version if
-        necessary. The uploaded vcl is set as main unless --include is given.
-        All existing vcl files will be deleted first if --delete is given.
+        Upload vcl files to a fastly service, cloning the current version if
+        necessary. Only files whose md5 differs from the vcl already on the
+        service are uploaded, and nothing is cloned or activated if no file
+        changed. A single uploaded vcl is set as main unless --include is
+        given, otherwise --main names the vcl to set as main. Existing vcl
+        files that are not being uploaded are deleted if --delete is given.
     """
 
-    parser = OptionParser(description=
-             "Upload a vcl file (set as main) to a given fastly service. All arguments are required.")
+    parser = OptionParser(usage="%prog [options] [file or directory ...]",
+             description="Upload vcl files (a single file is set as main) to "
+             "a given fastly service. Key, user, password, service and at "
+             "least one file are required.")
     parser.add_option("-k", "--key", dest="apikey", help="fastly api key")
     parser.add_option("-u", "--user", dest="user", help="fastly user name")
     parser.add_option("-p", "--password", dest="password",
                       help="fastly password")
-    parser.add_option("-f", "--file", dest="filename",
-                      help="vcl file to upload")
+    parser.add_option("-f", "--file", dest="filenames", action="append",
+                      default=[], help="vcl file or directory of vcl files\
+                            to upload, may be repeated")
     parser.add_option("-s", "--service", dest="service_name",
                       help="service to update")
     parser.add_option("-d", "--delete_vcl", action="store_true",
                       dest="delete_vcl", default=False,
                       help="delete existing vcl files from service\
-                            before uploading")
+                            that are not being uploaded")
     parser.add_option("-i", "--include", action="store_true",
                       dest="include_vcl", default=False,
                       help="do not set uploaded vcl as main,\
                             to be included only")
+    parser.add_option("-m", "--main", dest="main_vcl",
+                      help="name of the vcl to set as main")
+    parser.add_option("-P", "--parallelism", dest="parallelism",
+                      type="int", default=fastly.FASTLY_POOL_SIZE,
+                      help="number of uploads and deletions in flight at once")
+    parser.add_option("-n", "--name_cache", dest="name_cache",
+                      help="file caching service names between runs")
+    parser.add_option("-S", "--session_file", dest="session_file",
+                      help="file keeping the login session between runs")
 
     (options, args) = parser.parse_args()
-    for val in options.__dict__.values():
-        if val is None:
+    paths = options.filenames + args
+    for val in [options.apikey, options.user, options.password,
+                options.service_name]:
+        if val is None or not paths:
             print "Missing required options:"
             parser.print_help()
             sys.exit(1)
 
-    vcl_name = options.filename.split('/').pop()
     service_name = options.service_name
-    vcl_file = open(options.filename, 'r')
-    vcl_content = vcl_file.read()
+    vcls = read_vcls(paths)
+    main_vcl = options.main_vcl
+    if main_vcl is None and len(vcls) == 1 and options.include_vcl is False:
+        main_vcl = vcls.keys()[0]
 
     # Need to fully authenticate to access all features.
-    client = fastly.connect(options.apikey)
+    name_cache = None
+    if options.name_cache is not None:
+        name_cache = fastly.FastlyNameCache(path=options.name_cache)
+    session_store = None
+    if options.session_file is not None:
+        session_store = fastly.FastlySessionStore(options.session_file)
+    client = fastly.connect(options.apikey, pool_size=options.parallelism,
+                            name_cache=name_cache,
+                            session_store=session_store)
     client.login(options.user, options.password)
 
     service = client.get_service_by_name(service_name)
     versions = client.list_versions(service.id)
     latest = versions.pop()
 
+    existing = latest.vcls
+    changed = [name for name, content in sorted(vcls.items())
+               if name not in existing or
+               existing[name].md5 != hashlib.md5(content).hexdigest()]
+    deleted = []
+    if options.delete_vcl:
+        deleted = [name for name in sorted(existing) if name not in vcls]
+    set_main = main_vcl is not None and (main_vcl not in existing or
+                                         main_vcl in changed or
+                                         not existing[main_vcl].main)
+
+    if not changed and not deleted and not set_main:
+        if latest.active is True:
+            print "\n[ No vcl changes for service %s ]\n" % (service_name)
+            return
+
+        # The vcl is already on the latest version, possibly a draft left
+        # by an earlier run that failed before activating it.
+        client.activate_version(service.id, latest.number)
+        print "\n[ Activing configuration version %d ]\n" % (latest.number)
+        return
+
     if latest.locked is True or latest.active is True:
         print "\n[ Cloning version %d ]\n"\
             % (latest.number)
 
         latest = client.clone_version(service.id, latest.number)
 
-    if options.delete_vcl:
-        vcls = client.list_vcls(service.id, latest.number)
-        for vcl in vcls:
-            print "\n[ Deleting vcl file %s from version %d ]\n" %\
-                (service_name, latest.number)
-
-            client.delete_vcl(service.id, latest.number, vcl.name)
-
-    if vcl_name in latest.vcls:
-        print "\n[ Updating vcl file %s on service %s version %d ]\n"\
-            % (vcl_name, service_name, latest.number)
-
-        client.update_vcl(service.id, latest.number, vcl_name,
-                          content=vcl_content)
-    else:
-        print "\n[ Uploading new vcl file %s on service %s version %d ]\n"\
-            % (vcl_name, service_name, latest.number)
-
-        client.upload_vcl(service.id, latest.number, vcl_name, vcl_content)
-
-    if options.include_vcl is False:
-        print "\n[ Setting vcl %s as main ]\n" % (vcl_name)
-        client.set_main_vcl(service.id, latest.number, vcl_name)
+    workers = fastly.FastlyWorkerPool(options.parallelism)
+    futures = []
+    for name in deleted:
+        print "\n[ Deleting vcl file %s from version %d ]\n" %\
+            (name, latest.number)
+
+        futures.append(workers.submit(client.delete_vcl, service.id,
+                                      latest.number, name))
+
+    for name in changed:
+        if name in existing:
+            print "\n[ Updating vcl file %s on service %s version %d ]\n"\
+                % (name, service_name, latest.number)
+
+            futures.append(workers.submit(client.update_vcl, service.id,
+                                          latest.number, name,
+                                          content=vcls[name]))
+        else:
+            print "\n[ Uploading new vcl file %s on service %s version %d ]\n"\
+                % (name, service_name, latest.number)
+
+            futures.append(workers.submit(client.upload_vcl, service.id,
+                                          latest.number, name, vcls[name]))
+
+    for future in futures:
+        future.result()
+    workers.shutdown()
+
+    if set_main:
+        print "\n[ Setting vcl %s as main ]\n" % (main_vcl)
+        client.set_main_vcl(service.id, latest.number, main_vcl)
 
     client.activate_version(service.id, latest.number)
     print "\n[ Activing configuration version %d ]\n" % (latest.number)
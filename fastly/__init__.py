@@ -26,18 +26,66 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import array
+import bisect
+import collections
 from datetime import datetime
+import email.utils
+import gzip
+import httplib
+import hashlib
 import httplib2
 import json
+import logging
+import os
+import Queue
+import random
 import re
+import select
+import socket
+import sqlite3
+import ssl
+import struct
+import tempfile
+import threading
+import time
+import types
 import urllib
+import urlparse
 
 from version import __version__
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+try:
+	import h2.config
+	import h2.connection
+	import h2.events
+	import h2.exceptions
+except ImportError:
+	h2 = None
+
 FASTLY_SCHEME = "https"
 FASTLY_HOST = "api.fastly.com"
+FASTLY_POOL_SIZE = 4
+FASTLY_TIMEOUT = 10
+FASTLY_MAX_PURGE_KEYS = 256
+FASTLY_PURGE_WINDOW = 1.0
+FASTLY_VALIDATOR_ENTRIES = 256
+FASTLY_RATE_LIMIT_RESERVE = 100
+FASTLY_NAME_TTL = 300
+FASTLY_STATS_SETTLE = 900
+
+log = logging.getLogger("fastly")
 
 FASTLY_SESSION_REGEX = re.compile("(fastly\.session=[^;]+);")
+FASTLY_SERVICE_PATH_REGEX = re.compile("^/service/([^/?]+)(?:/version/(\d+))?")
+FASTLY_PURGE_PATH_REGEX = re.compile("^/service/[^/?]+/purge")
+FASTLY_CLONE_PATH_REGEX = re.compile("^/service/[^/?]+/version/\d+/clone")
+FASTLY_VERSION_STATE_PATH_REGEX = re.compile("^/service/[^/?]+/version/\d+/(?:activate|deactivate|clone)(?:$|\?)")
 
 
 class FastlyRoles(object):
@@ -95,6 +143,13 @@ class FastlyStatsType(object):
 	MINUTELY = "minutely"
 
 
+class FastlyStatsPeriod(object):
+	"""The length in seconds of one sample of each FastlyStatsType."""
+	MINUTELY = 60
+	HOURLY = 3600
+	DAILY = 86400
+
+
 class FastlyDirectorType(object):
 	RANDOM = 1
 	ROUNDROBIN = 2
@@ -102,30 +157,996 @@ class FastlyDirectorType(object):
 	CLIENT = 4
 
 
+class FastlyTransport(object):
+	"""Sends the HTTP requests of a FastlyConnection. request may be called from several threads at once and returns an (httplib2.Response, body) pair, or raises socket.error or httplib.HTTPException when no response arrived."""
+
+	def request(self, uri, method="GET", body=None, headers=None):
+		raise NotImplementedError()
+
+	def close(self):
+		pass
+
+
+class FastlyConnectionPool(FastlyTransport):
+	"""The default transport, a bounded pool of persistent httplib2.Http handles. Each handle keeps its connection to the API open between requests, so the TCP and TLS handshakes are paid once per handle instead of once per call. httplib2.Http is not thread-safe, so a handle is checked out for the duration of a request."""
+
+	def __init__(self, size=FASTLY_POOL_SIZE, timeout=FASTLY_TIMEOUT):
+		self.size = size
+		self.timeout = timeout
+		self._idle = Queue.LifoQueue()
+		self._slots = threading.BoundedSemaphore(size)
+
+	def request(self, uri, method="GET", body=None, headers=None):
+		self._slots.acquire()
+		try:
+			try:
+				http = self._idle.get_nowait()
+			except Queue.Empty:
+				http = httplib2.Http(disable_ssl_certificate_validation=False, timeout=self.timeout)
+			try:
+				result = http.request(uri, method, body=body, headers=headers)
+			except Exception:
+				# A handle that raised is dropped, its connection state is unknown.
+				self._close(http)
+				raise
+			self._idle.put(http)
+			return result
+		finally:
+			self._slots.release()
+
+	def close(self):
+		while True:
+			try:
+				http = self._idle.get_nowait()
+			except Queue.Empty:
+				return
+			self._close(http)
+
+	def _close(self, http):
+		for conn in http.connections.values():
+			conn.close()
+
+
+class FastlyHTTP2Transport(FastlyTransport):
+	"""A transport multiplexing every request as a stream of a single HTTP/2 connection per host, so any number of concurrent calls share one TLS socket, up to the number of concurrent streams the server allows. http URIs use cleartext HTTP/2 with prior knowledge. Requires the h2 package."""
+
+	def __init__(self, timeout=FASTLY_TIMEOUT):
+		if h2 is None:
+			raise ImportError("FastlyHTTP2Transport requires the h2 package.")
+		self.timeout = timeout
+		self._connections = {}
+		self._lock = threading.Lock()
+
+	def request(self, uri, method="GET", body=None, headers=None):
+		parts = urlparse.urlsplit(uri)
+		path = parts.path or "/"
+		if parts.query:
+			path = "%s?%s" % (path, parts.query)
+		key = (parts.scheme, parts.netloc)
+		with self._lock:
+			conn = self._connections.get(key)
+			if conn is None or conn.closed:
+				conn = _FastlyHTTP2Connection(parts.scheme, parts.netloc, self.timeout)
+				self._connections[key] = conn
+		return conn.request(method, path, body, headers or {})
+
+	def close(self):
+		with self._lock:
+			connections = self._connections.values()
+			self._connections = {}
+		for conn in connections:
+			conn.close()
+
+
+class _FastlyHTTP2Stream(object):
+	__slots__ = ("headers", "data", "error", "done")
+
+	def __init__(self):
+		self.headers = []
+		self.data = []
+		self.error = None
+		self.done = threading.Event()
+
+
+class _FastlyHTTP2Connection(object):
+	# Only the reader thread touches the socket. Callers change the h2 state
+	# under the condition's lock and wake the reader to send what it queued.
+
+	# Hop-by-hop headers are not allowed in HTTP/2.
+	HOP_HEADERS = frozenset(["connection", "host", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"])
+
+	def __init__(self, scheme, netloc, timeout):
+		self.scheme = scheme
+		self.netloc = netloc
+		self.timeout = timeout
+		self.closed = False
+		self._streams = {}
+		self._cond = threading.Condition()
+
+		host, _, port = netloc.partition(":")
+		port = int(port or (443 if scheme == "https" else 80))
+		sock = socket.create_connection((host, port), timeout)
+		if scheme == "https":
+			context = ssl.create_default_context()
+			context.set_alpn_protocols(["h2"])
+			sock = context.wrap_socket(sock, server_hostname=host)
+			if sock.selected_alpn_protocol() != "h2":
+				sock.close()
+				raise httplib.HTTPException("%s did not negotiate HTTP/2." % netloc)
+		sock.settimeout(None)
+		self._sock = sock
+
+		self._conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=True))
+		self._conn.initiate_connection()
+		self._wakeup_r, self._wakeup_w = os.pipe()
+		self._woken = False
+		self._thread = threading.Thread(target=self._run, name="fastly-http2-%s" % netloc)
+		self._thread.daemon = True
+		self._thread.start()
+		with self._cond:
+			self._wake()
+
+	def request(self, method, path, body, headers):
+		# A Host header, as sent by purge_url, becomes the :authority.
+		authority = self.netloc
+		for name, value in headers.items():
+			if name.lower() == "host":
+				authority = value
+		hdrs = [
+			(":method", method),
+			(":scheme", self.scheme),
+			(":authority", authority),
+			(":path", path),
+		]
+		for name, value in headers.items():
+			name = name.lower()
+			if name not in self.HOP_HEADERS:
+				hdrs.append((name, str(value)))
+		if body:
+			if isinstance(body, unicode):
+				body = body.encode("utf-8")
+			hdrs.append(("content-length", str(len(body))))
+
+		stream = _FastlyHTTP2Stream()
+		deadline = time.time() + self.timeout
+		with self._cond:
+			while not self.closed and self._conn.open_outbound_streams >= self._conn.remote_settings.max_concurrent_streams:
+				self._wait(deadline)
+			self._raise_if_closed()
+			stream_id = self._conn.get_next_available_stream_id()
+			self._streams[stream_id] = stream
+			self._conn.send_headers(stream_id, hdrs, end_stream=not body)
+			self._wake()
+			sent = 0
+			try:
+				while body and sent < len(body) and not stream.done.is_set():
+					size = min(self._conn.local_flow_control_window(stream_id), self._conn.max_outbound_frame_size, len(body) - sent)
+					if size > 0:
+						self._conn.send_data(stream_id, body[sent:sent + size], end_stream=sent + size == len(body))
+						sent += size
+						self._wake()
+					else:
+						self._wait(deadline)
+						self._raise_if_closed()
+			except socket.timeout:
+				self._reset(stream_id)
+				raise
+
+		if not stream.done.wait(max(deadline - time.time(), 0)):
+			with self._cond:
+				self._reset(stream_id)
+			raise socket.timeout("HTTP/2 stream %d timed out." % stream_id)
+		if stream.error is not None:
+			raise stream.error
+
+		info = {}
+		for name, value in stream.headers:
+			if name == ":status":
+				info["status"] = value
+			elif name in info:
+				info[name] = "%s, %s" % (info[name], value)
+			elif not name.startswith(":"):
+				info[name] = value
+		return (httplib2.Response(info), "".join(stream.data))
+
+	def close(self):
+		with self._cond:
+			if self.closed:
+				return
+			self._conn.close_connection()
+			self._wake()
+		self._fail(httplib.HTTPException("HTTP/2 connection closed."))
+
+	def _wait(self, deadline):
+		remaining = deadline - time.time()
+		if remaining <= 0:
+			raise socket.timeout("Timed out waiting on the HTTP/2 connection.")
+		self._cond.wait(remaining)
+
+	def _reset(self, stream_id):
+		# Called with the condition's lock held.
+		if self._streams.pop(stream_id, None) is not None and not self.closed:
+			try:
+				self._conn.reset_stream(stream_id)
+			except h2.exceptions.StreamClosedError:
+				pass
+			self._wake()
+
+	def _raise_if_closed(self):
+		if self.closed:
+			raise httplib.HTTPException("HTTP/2 connection closed.")
+
+	def _wake(self):
+		# Called with the condition's lock held, so the pipe is still open.
+		# One pending byte is enough, the reader flushes everything queued.
+		if self._wakeup_w is not None and not self._woken:
+			self._woken = True
+			os.write(self._wakeup_w, "x")
+
+	def _run(self):
+		try:
+			while True:
+				with self._cond:
+					data = self._conn.data_to_send()
+				if data:
+					self._sock.sendall(data)
+				with self._cond:
+					if self.closed and not self._streams:
+						return
+				readable, _, _ = select.select([self._sock, self._wakeup_r], [], [])
+				if self._wakeup_r in readable:
+					with self._cond:
+						os.read(self._wakeup_r, 1)
+						self._woken = False
+				if self._sock in readable:
+					data = self._sock.recv(65536)
+					# TLS may hold decrypted bytes select cannot see.
+					while getattr(self._sock, "pending", None) and self._sock.pending():
+						data += self._sock.recv(65536)
+					if not data:
+						raise httplib.HTTPException("HTTP/2 connection closed by the server.")
+					with self._cond:
+						self._dispatch(self._conn.receive_data(data))
+		except Exception as e:
+			self._fail(e)
+		finally:
+			self._sock.close()
+			with self._cond:
+				os.close(self._wakeup_r)
+				os.close(self._wakeup_w)
+				self._wakeup_w = None
+
+	def _dispatch(self, events):
+		for event in events:
+			if isinstance(event, h2.events.ResponseReceived):
+				stream = self._streams.get(event.stream_id)
+				if stream is not None:
+					stream.headers = event.headers
+			elif isinstance(event, h2.events.DataReceived):
+				self._conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+				stream = self._streams.get(event.stream_id)
+				if stream is not None:
+					stream.data.append(event.data)
+			elif isinstance(event, h2.events.StreamEnded):
+				stream = self._streams.pop(event.stream_id, None)
+				if stream is not None:
+					stream.done.set()
+			elif isinstance(event, h2.events.StreamReset):
+				stream = self._streams.pop(event.stream_id, None)
+				if stream is not None:
+					stream.error = httplib.HTTPException("HTTP/2 stream %d reset with error %s." % (event.stream_id, event.error_code))
+					stream.done.set()
+			elif isinstance(event, h2.events.ConnectionTerminated):
+				if event.error_code:
+					raise httplib.HTTPException("HTTP/2 connection terminated with error %s." % event.error_code)
+				# A graceful GOAWAY. Streams the server accepted still finish,
+				# new requests go to a new connection.
+				self.closed = True
+				for stream_id in self._streams.keys():
+					if event.last_stream_id is None or stream_id > event.last_stream_id:
+						stream = self._streams.pop(stream_id)
+						stream.error = httplib.HTTPException("HTTP/2 stream %d refused by GOAWAY." % stream_id)
+						stream.done.set()
+		# Window updates and settings changes may unblock senders.
+		self._cond.notify_all()
+
+	def _fail(self, error):
+		if not isinstance(error, (socket.error, httplib.HTTPException)):
+			error = httplib.HTTPException(str(error))
+		with self._cond:
+			self.closed = True
+			streams = self._streams.values()
+			self._streams = {}
+			self._cond.notify_all()
+		for stream in streams:
+			stream.error = error
+			stream.done.set()
+
+
+class FastlyFuture(object):
+	"""The pending result of a call submitted to a FastlyWorkerPool."""
+
+	def __init__(self):
+		self._event = threading.Event()
+		self._result = None
+		self._error = None
+
+	def done(self):
+		return self._event.is_set()
+
+	def result(self, timeout=None):
+		if not self._event.wait(timeout):
+			raise FastlyError("Timed out waiting for result.")
+		if self._error is not None:
+			raise self._error
+		return self._result
+
+	def exception(self, timeout=None):
+		if not self._event.wait(timeout):
+			raise FastlyError("Timed out waiting for result.")
+		return self._error
+
+	def _set_result(self, result):
+		self._result = result
+		self._event.set()
+
+	def _set_error(self, error):
+		self._error = error
+		self._event.set()
+
+
+class FastlyWorkerPool(object):
+	"""A fixed set of daemon threads running submitted calls. The number of workers bounds how many requests are in flight, and backlog bounds how many calls may wait in the queue before submit() blocks."""
+
+	def __init__(self, workers=FASTLY_POOL_SIZE, backlog=0):
+		self._queue = Queue.Queue(backlog)
+		self._threads = []
+		for i in range(workers):
+			thread = threading.Thread(target=self._run)
+			thread.daemon = True
+			thread.start()
+			self._threads.append(thread)
+
+	def submit(self, fn, *args, **kwargs):
+		future = FastlyFuture()
+		self._queue.put((future, fn, args, kwargs))
+		return future
+
+	def shutdown(self):
+		for thread in self._threads:
+			self._queue.put(None)
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
+
+	def _run(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				return
+			future, fn, args, kwargs = item
+			try:
+				future._set_result(fn(*args, **kwargs))
+			except Exception, e:
+				future._set_error(e)
+
+
+class FastlyRateLimiter(object):
+	"""A token bucket shared by every thread that calls acquire(). Allows up to burst calls at once and rate calls per second on average."""
+
+	def __init__(self, rate, burst=None):
+		self.rate = float(rate)
+		self.burst = float(burst or max(1, rate))
+		self._tokens = self.burst
+		self._last = time.time()
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self._lock:
+				now = time.time()
+				self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+				self._last = now
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				wait = (1 - self._tokens) / self.rate
+			time.sleep(wait)
+
+
+class FastlyPurgeQueue(object):
+	"""Collects purges and sends them in batches from a background thread every window seconds. Identical purges queued within the same window are sent once and share a FastlyFuture, which callers may wait on or ignore."""
+
+	def __init__(self, conn, window=FASTLY_PURGE_WINDOW):
+		self._conn = conn
+		self.window = window
+		self._lock = threading.Lock()
+		self._urls = {}
+		self._keys = {}
+		self._closed = False
+		self._wakeup = threading.Event()
+		self._thread = threading.Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def purge_url(self, host, path):
+		"""Queue a purge of an individual URL. The future resolves to a FastlyPurge."""
+		return self._enqueue(self._urls, (host, path))
+
+	def purge_key(self, service_id, key, soft=False):
+		"""Queue a purge of a service by a key. The future resolves to the purge id."""
+		return self._enqueue(self._keys, (service_id, bool(soft), key))
+
+	def flush(self):
+		"""Send every queued purge now, waiting for them to complete."""
+		self._send()
+
+	def close(self):
+		"""Send the remaining purges and stop the background thread."""
+		with self._lock:
+			self._closed = True
+		self._wakeup.set()
+		self._thread.join()
+
+	def _enqueue(self, pending, item):
+		with self._lock:
+			if self._closed:
+				raise FastlyError("Purge queue is closed.")
+			future = pending.get(item)
+			if future is None:
+				future = pending[item] = FastlyFuture()
+			return future
+
+	def _run(self):
+		while True:
+			self._wakeup.wait(self.window)
+			self._wakeup.clear()
+			closed = self._closed
+			self._send()
+			if closed:
+				return
+
+	def _send(self):
+		with self._lock:
+			urls, self._urls = self._urls, {}
+			keys, self._keys = self._keys, {}
+
+		if urls:
+			for url, purge, error in self._conn.purge_urls(urls.keys()):
+				if error is not None:
+					urls[url]._set_error(error)
+				else:
+					urls[url]._set_result(purge)
+
+		batches = {}
+		for service_id, soft, key in keys:
+			batches.setdefault((service_id, soft), []).append(key)
+		for (service_id, soft), batch in batches.items():
+			try:
+				purge_ids = self._conn.purge_service_by_keys(service_id, batch, soft=soft)
+			except Exception, e:
+				for key in batch:
+					keys[(service_id, soft, key)]._set_error(e)
+				continue
+			for key in batch:
+				keys[(service_id, soft, key)]._set_result(purge_ids.get(key))
+
+
+class FastlyResponseCache(object):
+	"""An LRU cache of decoded GET responses keyed on the request path. Entries expire after ttl seconds, except the configuration of locked versions which can never change and is kept until evicted. Writes made through the connection invalidate the entries they may have changed."""
+
+	def __init__(self, max_entries=1024, ttl=60):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+		self._entries = collections.OrderedDict()
+		self._locked = set()
+		self._lock = threading.Lock()
+
+	@property
+	def stats(self):
+		return {
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"invalidations": self.invalidations,
+			"entries": len(self._entries),
+		}
+
+	def get(self, path):
+		"""Returns a (hit, payload) tuple."""
+		with self._lock:
+			entry = self._entries.pop(path, None)
+			if entry is None or (entry[0] is not None and entry[0] < time.time()):
+				self.misses += 1
+				return (False, None)
+			self._entries[path] = entry
+			self.hits += 1
+			return (True, entry[1])
+
+	def put(self, path, payload):
+		with self._lock:
+			self._learn_locked(path, payload)
+			expires = None if self._immutable(path) else time.time() + self.ttl
+			self._entries.pop(path, None)
+			self._entries[path] = (expires, payload)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+
+	def invalidate(self, path):
+		"""Drop the entries a write to path may have changed. A write to a version drops that version's configuration and the service level listings. Activating, deactivating or cloning a version also changes the other versions, so it drops everything cached for the service, as does any other write to a service. Writes outside of a service drop everything. The configuration of locked versions is always kept."""
+		match = FASTLY_SERVICE_PATH_REGEX.match(path)
+		with self._lock:
+			for key in self._entries.keys():
+				if self._affected(match, key):
+					del self._entries[key]
+					self.invalidations += 1
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._locked.clear()
+
+	def _affected(self, match, key):
+		if match is None:
+			return self._entries[key][0] is not None
+		if key.startswith("/service/search"):
+			return True
+		key_match = FASTLY_SERVICE_PATH_REGEX.match(key)
+		if key_match is None or key_match.group(1) != match.group(1):
+			return False
+		if match.group(2) is None or FASTLY_VERSION_STATE_PATH_REGEX.match(match.string):
+			return self._entries[key][0] is not None
+		return key_match.group(2) is None or key_match.group(2) == match.group(2)
+
+	def _immutable(self, path):
+		match = FASTLY_SERVICE_PATH_REGEX.match(path)
+		if match is None or match.group(2) is None or len(path) == match.end():
+			return False
+		# Health and DNS checks are live even for locked versions.
+		if "check" in path:
+			return False
+		return (match.group(1), match.group(2)) in self._locked
+
+	def _learn_locked(self, path, payload):
+		self._locked.update(_locked_versions(path, payload))
+
+
+class FastlyVCLCache(object):
+	"""An on-disk, content-addressed store of VCL bodies. Bodies are kept once per md5, so a VCL is only downloaded when its md5 is new. The metadata of VCLs from locked versions, which can never change, is indexed by service, version and name so they can be served without any request. A version is known to be locked once a response describing it has been seen."""
+
+	def __init__(self, directory):
+		self.directory = directory
+		self.hits = 0
+		self.misses = 0
+
+	def observe(self, path, payload):
+		"""Record the locked versions described by a response."""
+		for service_id, version_number in _locked_versions(path, payload):
+			marker = os.path.join(self._version_dir(service_id, version_number), "locked")
+			if not os.path.exists(marker):
+				self._write(marker, "")
+
+	def is_locked(self, service_id, version_number):
+		return os.path.exists(os.path.join(self._version_dir(service_id, version_number), "locked"))
+
+	def get_body(self, md5):
+		if not md5:
+			return None
+		try:
+			with open(os.path.join(self.directory, "bodies", md5), "rb") as f:
+				return f.read().decode("utf-8")
+		except IOError:
+			return None
+
+	def get_vcl(self, service_id, version_number, name=None):
+		"""Returns the data of a VCL of a locked version, or of its generated VCL when name is None, or None if it is not cached."""
+		try:
+			with open(self._index_path(service_id, version_number, name), "rb") as f:
+				data = json.loads(f.read())
+		except IOError:
+			self.misses += 1
+			return None
+		data["content"] = self.get_body(data.get("md5"))
+		if data["content"] is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return data
+
+	def put_vcl(self, service_id, version_number, name, data):
+		"""Store the body of a VCL, and index its metadata if its version is locked. name is None for generated VCL."""
+		content = data.get("content")
+		if content is None:
+			return
+		body = content.encode("utf-8") if isinstance(content, unicode) else content
+		md5 = hashlib.md5(body).hexdigest()
+		body_path = os.path.join(self.directory, "bodies", md5)
+		if not os.path.exists(body_path):
+			self._write(body_path, body)
+		if self.is_locked(service_id, version_number):
+			meta = dict([(k, v) for k, v in data.items() if k != "content"])
+			meta["md5"] = md5
+			self._write(self._index_path(service_id, version_number, name), json.dumps(meta))
+
+	def _version_dir(self, service_id, version_number):
+		return os.path.join(self.directory, "versions", urllib.quote(str(service_id), safe=''), str(version_number))
+
+	def _index_path(self, service_id, version_number, name):
+		if name is None:
+			return os.path.join(self._version_dir(service_id, version_number), "generated_vcl.json")
+		return os.path.join(self._version_dir(service_id, version_number), "vcl", "%s.json" % urllib.quote(name, safe=''))
+
+	def _write(self, path, data):
+		# Write to a temporary file and rename it so readers never see a partial file.
+		dirname = os.path.dirname(path)
+		if not os.path.isdir(dirname):
+			try:
+				os.makedirs(dirname)
+			except OSError:
+				if not os.path.isdir(dirname):
+					raise
+		fd, tmp = tempfile.mkstemp(dir=dirname)
+		with os.fdopen(fd, "wb") as f:
+			f.write(data)
+		os.rename(tmp, path)
+
+
+def _locked_versions(path, payload):
+	"""Returns the (service_id, version_number) pairs of the locked versions described by the response to a GET of path."""
+	match = FASTLY_SERVICE_PATH_REGEX.match(path)
+	if match is None:
+		return set()
+	if isinstance(payload, dict):
+		versions = [payload] + list(payload.get("versions") or [])
+	elif isinstance(payload, list):
+		versions = payload
+	else:
+		return set()
+	locked = set()
+	for version in versions:
+		if isinstance(version, dict) and version.get("locked") and "number" in version:
+			locked.add((version.get("service_id") or match.group(1), str(version["number"])))
+	return locked
+
+
+class FastlyValidatorCache(object):
+	"""Remembers the ETag and Last-Modified validators of recent GET responses along with their decoded payloads, so an unchanged resource can be revalidated with a conditional request and a bodiless 304. Pass one to FastlyConnection as validators to enable it, sized for the payloads it may hold."""
+
+	def __init__(self, max_entries=FASTLY_VALIDATOR_ENTRIES):
+		self.max_entries = max_entries
+		self.hits = 0
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def conditional(self, url):
+		"""Returns the conditional request headers for url and the payload to use if the server answers 304."""
+		with self._lock:
+			entry = self._entries.get(url)
+		if entry is None:
+			return ({}, None)
+		etag, last_modified, payload = entry
+		hdrs = {}
+		if etag:
+			hdrs["If-None-Match"] = etag
+		if last_modified:
+			hdrs["If-Modified-Since"] = last_modified
+		return (hdrs, payload)
+
+	def revalidated(self, url):
+		with self._lock:
+			self.hits += 1
+			entry = self._entries.pop(url, None)
+			if entry is not None:
+				self._entries[url] = entry
+
+	def put(self, url, resp, payload):
+		etag = resp.get("etag")
+		last_modified = resp.get("last-modified")
+		with self._lock:
+			self._entries.pop(url, None)
+			if etag is None and last_modified is None:
+				return
+			self._entries[url] = (etag, last_modified, payload)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+
+class FastlyNameCache(object):
+	"""Resolves service names from the services returned by one list_services call, kept for ttl seconds and optionally persisted to a JSON file so they survive across runs. The connection clears it whenever it creates, updates or deletes a service."""
+
+	def __init__(self, ttl=FASTLY_NAME_TTL, path=None):
+		self.ttl = ttl
+		self.path = path
+		self.hits = 0
+		self.misses = 0
+		self._services = {}
+		self._loaded = None
+		self._lock = threading.Lock()
+		if path is not None:
+			self._read()
+
+	@property
+	def fresh(self):
+		return self._loaded is not None and time.time() - self._loaded < self.ttl
+
+	def get(self, name):
+		"""Returns the data of the service called name, or None when it is unknown or the cache has expired."""
+		with self._lock:
+			data = self._services.get(name) if self.fresh else None
+			if data is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+			return data
+
+	def fill(self, services):
+		"""Replace the cache with the data of every service of the account."""
+		with self._lock:
+			self._services = dict([(data["name"], data) for data in services])
+			self._loaded = time.time()
+			self._write()
+
+	def put(self, data):
+		with self._lock:
+			if self.fresh:
+				self._services[data["name"]] = data
+				self._write()
+
+	def clear(self):
+		with self._lock:
+			self._services = {}
+			self._loaded = None
+			if self.path is not None and os.path.exists(self.path):
+				os.remove(self.path)
+
+	def _read(self):
+		try:
+			with open(self.path, "rb") as f:
+				data = json.loads(f.read())
+		except (IOError, ValueError):
+			return
+		self._services = data["services"]
+		self._loaded = data["loaded"]
+
+	def _write(self):
+		if self.path is None:
+			return
+		tmp = "%s.tmp" % self.path
+		with open(tmp, "wb") as f:
+			f.write(json.dumps({"loaded": self._loaded, "services": self._services}))
+		os.rename(tmp, self.path)
+
+
+class FastlySessionStore(object):
+	"""Keeps the session cookie of the last login, along with the user it belongs to, in a file only its owner can read, so later processes logging in as the same user can reuse the session instead of posting their credentials again."""
+
+	def __init__(self, path):
+		self.path = path
+
+	def load(self, user):
+		"""Returns the (session cookie, login response) stored for user, or None."""
+		try:
+			with open(self.path, "rb") as f:
+				data = json.loads(f.read())
+		except (IOError, ValueError):
+			return None
+		if data.get("user") != user or not data.get("session"):
+			return None
+		return (str(data["session"]), data.get("payload"))
+
+	def save(self, user, session, payload):
+		tmp = "%s.tmp" % self.path
+		fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+		try:
+			os.fchmod(fd, 0600)
+			os.write(fd, json.dumps({"user": user, "session": session, "payload": payload}))
+		finally:
+			os.close(fd)
+		os.rename(tmp, self.path)
+
+	def clear(self):
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+
+class FastlyAdaptiveRateLimiter(FastlyRateLimiter):
+	"""Paces requests to the rate limit reported by the API. Requests are not delayed until a response carries the Fastly-RateLimit-Remaining and Fastly-RateLimit-Reset headers. From then on all but reserve of the remaining requests may be made at full speed, and only once the reserve is reached is it spread evenly over the time left until the reset, so callers are slowed down before the limit is hit rather than failing once it is."""
+
+	def __init__(self, reserve=FASTLY_RATE_LIMIT_RESERVE):
+		FastlyRateLimiter.__init__(self, 1)
+		self.reserve = reserve
+		self.rate = None
+
+	def acquire(self):
+		if self.rate is not None:
+			FastlyRateLimiter.acquire(self)
+
+	def update(self, remaining, reset):
+		"""Adjust to remaining requests allowed until the reset epoch time."""
+		with self._lock:
+			now = time.time()
+			self._last = now
+			self.rate = max(remaining, 1) / max(reset - now, 1.0)
+			self._tokens = max(remaining - self.reserve, 0)
+			self.burst = max(self._tokens, 1)
+
+
+class FastlyRetryPolicy(object):
+	"""Decides whether and when a failed request is retried. Delays grow exponentially from backoff with full jitter, and a Retry-After header is honoured when present. Each request adds budget_ratio to a budget of at most min_budget retries, so sustained failures are retried for only a fraction of requests. Only idempotent methods are retried unless retry_post is set, and a PUT cloning a version, which creates a new version each time, is only retried if retry_clone is set."""
+
+	IDEMPOTENT_METHODS = ["GET", "HEAD", "PURGE", "PUT", "DELETE"]
+
+	def __init__(self, retries=3, backoff=0.5, max_backoff=30.0, statuses=(429, 500, 502, 503, 504), retry_post=False, budget_ratio=0.2, min_budget=10, retry_clone=False):
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.statuses = statuses
+		self.retry_post = retry_post
+		self.retry_clone = retry_clone
+		self.budget_ratio = budget_ratio
+		self.min_budget = min_budget
+		self._budget = float(min_budget)
+		self._lock = threading.Lock()
+
+	def started(self):
+		"""Record a new request, refilling the retry budget."""
+		with self._lock:
+			self._budget = min(self.min_budget, self._budget + self.budget_ratio)
+
+	def delay(self, method, attempt, status=None, retry_after=None, url=None):
+		"""Returns the seconds to wait before retrying, or None if the request should not be retried. status is None for a connection error."""
+		if attempt >= self.retries:
+			return None
+		if status is not None and status not in self.statuses:
+			return None
+		if method not in self.IDEMPOTENT_METHODS and not (method == "POST" and self.retry_post):
+			return None
+		if method == "PUT" and url is not None and FASTLY_CLONE_PATH_REGEX.match(url) and not self.retry_clone:
+			return None
+		with self._lock:
+			if self._budget < 1:
+				return None
+			self._budget -= 1
+		delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+		if retry_after:
+			delay = max(delay, self._parse_retry_after(retry_after))
+		return delay
+
+	def _parse_retry_after(self, retry_after):
+		try:
+			return max(0, int(retry_after))
+		except ValueError:
+			parsed = email.utils.parsedate_tz(retry_after)
+			if parsed is None:
+				return 0
+			return max(0, email.utils.mktime_tz(parsed) - time.time())
+
+
 class FastlyConnection(object):
-	def __init__(self, api_key):
+	def __init__(self, api_key, pool_size=FASTLY_POOL_SIZE, timeout=FASTLY_TIMEOUT, purge_window=FASTLY_PURGE_WINDOW, cache=None, retry_policy=None, vcl_cache=None, name_cache=None, session_store=None, transport=None, validators=None, rate_limiter=None):
 		self._session = None
 		self._api_key = api_key
 		self._fully_authed = False
+		self._session_store = session_store
+		self._credentials = None
+		self._reused_session = False
+		self._session_lock = threading.Lock()
+		self._transport = transport or FastlyConnectionPool(pool_size, timeout)
+		self._cache = cache
+		self._vcl_cache = vcl_cache
+		self._validators = validators
+		self._names = name_cache or FastlyNameCache()
+		self._hooks = ()
+		self._rate_limiter = rate_limiter
+		self._retry_policy = retry_policy or FastlyRetryPolicy()
+		self._stats = collections.Counter()
+		self._stats_lock = threading.Lock()
+		self._purge_window = purge_window
+		self._purge_queue = None
+		self._purge_queue_lock = threading.Lock()
 
 	@property
 	def fully_authed(self):
 		return self._fully_authed
 
+	def add_hook(self, hook):
+		"""Register hook(method, path, status, latency, bytes_sent, bytes_received) to be called after every request. status is None when the request failed before a response arrived. See log_request for a stock hook."""
+		self._hooks = self._hooks + (hook,)
+
+	def remove_hook(self, hook):
+		self._hooks = tuple(h for h in self._hooks if h is not hook)
+
+	@property
+	def stats(self):
+		"""Counters of requests sent, retries and requests that failed for good, plus the cache statistics."""
+		with self._stats_lock:
+			stats = dict(self._stats)
+		if self._validators is not None:
+			stats["conditional_hits"] = self._validators.hits
+		stats["name_cache"] = {"hits": self._names.hits, "misses": self._names.misses}
+		if self._cache is not None:
+			stats["cache"] = self._cache.stats
+		if self._vcl_cache is not None:
+			stats["vcl_cache"] = {"hits": self._vcl_cache.hits, "misses": self._vcl_cache.misses}
+		return stats
+
+	@property
+	def retry_policy(self):
+		return self._retry_policy
+
+	@property
+	def rate_limiter(self):
+		"""The rate limiter, such as a FastlyAdaptiveRateLimiter, pacing rate limited requests from every thread using this connection, or None."""
+		return self._rate_limiter
+
+	@property
+	def cache(self):
+		"""The FastlyResponseCache serving GET requests, or None when caching is disabled."""
+		return self._cache
+
+	@property
+	def purge_queue(self):
+		"""The FastlyPurgeQueue coalescing purges made through this connection, started on first use."""
+		with self._purge_queue_lock:
+			if self._purge_queue is None:
+				self._purge_queue = FastlyPurgeQueue(self, self._purge_window)
+			return self._purge_queue
+
+	def close(self):
+		"""Flush queued purges and close the persistent connections held by this client."""
+		with self._purge_queue_lock:
+			if self._purge_queue is not None:
+				self._purge_queue.close()
+				self._purge_queue = None
+		self._transport.close()
+
 	def login(self, user, password):
+		"""Log in as user. With a session store, a session stored for the same user is reused without a request, and the connection logs in again by itself if the API rejects it."""
+		if self._session_store is not None:
+			stored = self._session_store.load(user)
+			if stored is not None:
+				self._session, content = stored
+				self._credentials = (user, password)
+				self._reused_session = True
+				self._fully_authed = True
+				return FastlySession(self, content)
+		return self._login(user, password)
+
+	def _login(self, user, password):
 		body = self._formdata({
 			"user": user,
 			"password": password,
 		}, ["user", "password"])
 		content = self._fetch("/login", method="POST", body=body)
+		self._credentials = (user, password)
+		self._reused_session = False
 		self._fully_authed = True
+		if self._session_store is not None:
+			self._session_store.save(user, self._session, content)
 		return FastlySession(self, content)
 
+	def _relogin(self, rejected):
+		with self._session_lock:
+			if self._session == rejected and self._reused_session:
+				self._session_store.clear()
+				self._fully_authed = False
+				self._login(*self._credentials)
+
 	def list_backends(self, service_id, version_number):
 		"""List all backends for a particular service and version."""
 		content = self._fetch("/service/%s/version/%d/backend" % (service_id, version_number))
 		return map(lambda x: FastlyBackend(self, x), content)
 
+	def iter_backends(self, service_id, version_number):
+		"""Like list_backends, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/backend" % (service_id, version_number))
+		return (FastlyBackend(self, x) for x in content)
+
 	def create_backend(
 		self,
 		service_id,
@@ -201,6 +1222,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/cache_settings" % (service_id, version_number))
 		return map(lambda x: FastlyCacheSettings(self, x), content)
 
+	def iter_cache_settings(self, service_id, version_number):
+		"""Like list_cache_settings, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/cache_settings" % (service_id, version_number))
+		return (FastlyCacheSettings(self, x) for x in content)
+
 	def create_cache_settings(
 		self,
 		service_id,
@@ -242,6 +1268,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/condition" % (service_id, version_number))
 		return map(lambda x: FastlyCondition(self, x), content)
 
+	def iter_conditions(self, service_id, version_number):
+		"""Like list_conditions, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/condition" % (service_id, version_number))
+		return (FastlyCondition(self, x) for x in content)
+
 	def create_condition(
 		self,
 		service_id,
@@ -326,6 +1357,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/director" % (service_id, version_number))
 		return map(lambda x: FastlyDirector(self, x), content)
 
+	def iter_directors(self, service_id, version_number):
+		"""Like list_directors, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/director" % (service_id, version_number))
+		return (FastlyDirector(self, x) for x in content)
+
 	def create_director(
 		self,
 		service_id,
@@ -385,6 +1421,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/domain" % (service_id, version_number))
 		return map(lambda x: FastlyDomain(self, x), content)
 
+	def iter_domains(self, service_id, version_number):
+		"""Like list_domains, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/domain" % (service_id, version_number))
+		return (FastlyDomain(self, x) for x in content)
+
 	def create_domain(
 		self,
 		service_id,
@@ -436,6 +1477,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/gzip" % (service_id, version_number))
 		return map(lambda x: FastlyGzip(self, x), content)
 
+	def iter_gzip(self, service_id, version_number):
+		"""Like list_gzip, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/gzip" % (service_id, version_number))
+		return (FastlyGzip(self, x) for x in content)
+
 	def create_gzip(self, service_id, version_number, name, cache_condition=None, content_types=None, extensions=None):
 		body = self._formdata({
 			"name": name,
@@ -468,6 +1514,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/header" % (service_id, version_number))
 		return map(lambda x: FastlyHeader(self, x), content)
 
+	def iter_headers(self, service_id, version_number):
+		"""Like list_headers, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/header" % (service_id, version_number))
+		return (FastlyHeader(self, x) for x in content)
+
 	def create_header(self, service_id, version_number, name, dst, src, _type=FastlyHeaderType.RESPONSE, action=FastlyHeaderAction.SET, regex=None, substitution=None, ignore_if_set=None, priority=10, response_condition=None, cache_condition=None, request_condition=None):
 		body = self._formdata({
 			"name": name,
@@ -510,6 +1561,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/healthcheck" % (service_id, version_number))
 		return map(lambda x: FastlyHealthCheck(self, x), content)
 
+	def iter_healthchecks(self, service_id, version_number):
+		"""Like list_healthchecks, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/healthcheck" % (service_id, version_number))
+		return (FastlyHealthCheck(self, x) for x in content)
+
 	def create_healthcheck(
 		self,
 		service_id,
@@ -563,6 +1619,34 @@ class FastlyConnection(object):
 		content = self._fetch(path, method="PURGE", headers={"Host": host})
 		return FastlyPurge(self, content)
 
+	def purge_urls(self, urls, parallelism=FASTLY_POOL_SIZE, rate=None):
+		"""Purge many URLs concurrently. urls may be any iterable, including a generator, of full URLs or (host, path) tuples. Yields a (url, purge, error) tuple for each URL in input order, where purge is a FastlyPurge on success and error is the exception otherwise. At most parallelism purges are in flight and at most rate are started per second, so memory use does not grow with the number of URLs."""
+		limiter = FastlyRateLimiter(rate) if rate else None
+		workers = FastlyWorkerPool(parallelism)
+		pending = collections.deque()
+		try:
+			for url in urls:
+				if isinstance(url, basestring):
+					parsed = urlparse.urlsplit(url if "//" in url else "//" + url)
+					host, path = parsed.netloc, urlparse.urlunsplit(("", "", parsed.path or "/", parsed.query, ""))
+				else:
+					host, path = url
+				if limiter is not None:
+					limiter.acquire()
+				pending.append((url, workers.submit(self.purge_url, host, path)))
+				if len(pending) > parallelism:
+					yield self._purge_result(*pending.popleft())
+			while pending:
+				yield self._purge_result(*pending.popleft())
+		finally:
+			workers.shutdown()
+
+	def _purge_result(self, url, future):
+		error = future.exception()
+		if error is not None:
+			return (url, None, error)
+		return (url, future.result(), None)
+
 	def check_purge_status(self, purge_id):
 		"""Get the status and times of a recently completed purge."""
 		content = self._fetch("/purge?id=%s" % purge_id)
@@ -573,6 +1657,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/request_settings" % (service_id, version_number))
 		return map(lambda x: FastlyRequestSetting(self, x), content)
 
+	def iter_request_settings(self, service_id, version_number):
+		"""Like list_request_settings, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/request_settings" % (service_id, version_number))
+		return (FastlyRequestSetting(self, x) for x in content)
+
 	def create_request_setting(
 		self,
 		service_id,
@@ -628,6 +1717,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/response_object" % (service_id, version_number))
 		return map(lambda x: FastlyResponseObject(self, x), content)
 
+	def iter_response_objects(self, service_id, version_number):
+		"""Like list_response_objects, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/response_object" % (service_id, version_number))
+		return (FastlyResponseObject(self, x) for x in content)
+
 	def create_response_object(self, service_id, version_number, name, status="200", response="OK", content="", request_condition=None, cache_condition=None):
 		"""Creates a new Response Object."""
 		body = self._formdata({
@@ -666,13 +1760,20 @@ class FastlyConnection(object):
 			"comment": comment,
 		}, FastlyService.FIELDS)
 		content = self._fetch("/service", method="POST", body=body)
+		self._names.clear()
 		return FastlyService(self, content)
 		
 	def list_services(self):
 		"""List Services."""
 		content = self._fetch("/service")
+		self._names.fill(content)
 		return map(lambda x: FastlyService(self, x), content)
 
+	def iter_services(self):
+		"""Like list_services, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service")
+		return (FastlyService(self, x) for x in content)
+
 	def get_service(self, service_id):
 		"""Get a specific service by id."""
 		content = self._fetch("/service/%s" % service_id)
@@ -684,19 +1785,31 @@ class FastlyConnection(object):
 		return FastlyService(self, content)
 
 	def get_service_by_name(self, service_name):
-		"""Get a specific service by name."""
-		content = self._fetch("/service/search?name=%s" % urllib.quote(service_name, safe=''))
+		"""Get a specific service by name. Names are resolved from the name cache, which one list_services call fills for the whole account, so the service data may be up to the cache's ttl old; names it does not know are searched for."""
+		content = self._names.get(service_name)
+		if content is None and not self._names.fresh:
+			self.list_services()
+			content = self._names.get(service_name)
+		if content is None:
+			content = self._fetch("/service/search?name=%s" % urllib.quote(service_name, safe=''))
+			self._names.put(content)
 		return FastlyService(self, content)
 
+	def get_service_id(self, service_name):
+		"""Resolve a service name to its id."""
+		return self.get_service_by_name(service_name).id
+
 	def update_service(self, service_id, **kwargs):
 		"""Update a service."""
 		body = self._formdata(kwargs, FastlyService.FIELDS)
 		content = self._fetch("/service/%s" % service_id, method="PUT", body=body)
+		self._names.clear()
 		return FastlyService(self, content)
 
 	def delete_service(self, service_id):
 		"""Delete a service."""
 		content = self._fetch("/service/%s" % service_id, method="DELETE")
+		self._names.clear()
 		return self._status(content)
 
 	def list_domains_by_service(self, service_id):
@@ -704,6 +1817,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/domain" % service_id, method="GET")
 		return map(lambda x: FastlyDomain(self, x), content)
 
+	def iter_domains_by_service(self, service_id):
+		"""Like list_domains_by_service, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/domain" % service_id)
+		return (FastlyDomain(self, x) for x in content)
+
 	def purge_service(self, service_id):
 		"""Purge everything from a service."""
 		content = self._fetch("/service/%s/purge_all" % service_id, method="POST")
@@ -714,6 +1832,33 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/purge/%s" % (service_id, key), method="POST")
 		return self._status(content)
 
+	def purge_service_by_keys(self, service_id, keys, soft=False, parallelism=FASTLY_POOL_SIZE):
+		"""Purge a particular service by many keys. The keys are sent FASTLY_MAX_PURGE_KEYS at a time in a Surrogate-Key header, with the batches purged in parallel. Returns a dict mapping each key to its purge id."""
+		unique = []
+		seen = set()
+		for key in keys:
+			if key not in seen:
+				seen.add(key)
+				unique.append(key)
+
+		headers = {}
+		if soft:
+			headers["Fastly-Soft-Purge"] = "1"
+
+		workers = FastlyWorkerPool(parallelism)
+		try:
+			futures = []
+			for i in range(0, len(unique), FASTLY_MAX_PURGE_KEYS):
+				batch_headers = dict(headers)
+				batch_headers["Surrogate-Key"] = " ".join(unique[i:i + FASTLY_MAX_PURGE_KEYS])
+				futures.append(workers.submit(self._fetch, "/service/%s/purge" % service_id, method="POST", headers=batch_headers))
+			purge_ids = {}
+			for future in futures:
+				purge_ids.update(future.result())
+			return purge_ids
+		finally:
+			workers.shutdown()
+
 	def get_settings(self, service_id, version_number):
 		"""Get the settings for a particular service and version."""
 		content = self._fetch("/service/%s/version/%d/settings" % (service_id, version_number))
@@ -725,16 +1870,82 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/settings" % (service_id, version_number), method="PUT", body=body)
 		return FastlySettings(self, content)
 
-	def get_stats(self, service_id, stat_type=FastlyStatsType.ALL):
-		"""Get the stats from a service."""
-		content = self._fetch("/service/%s/stats/%s" % (service_id, stat_type))
+	def get_stats(self, service_id, stat_type=FastlyStatsType.ALL, columnar=False, start=None, end=None):
+		"""Get the stats from a service, optionally limited to the epoch times start <= t < end. With columnar, returns the samples as a FastlyStats."""
+		query = dict([(k, int(v)) for k, v in [("from", start), ("to", end)] if v is not None])
+		url = "/service/%s/stats/%s" % (service_id, stat_type)
+		if query:
+			url += "?" + urllib.urlencode(sorted(query.items()))
+		content = self._fetch(url)
+		if columnar:
+			return FastlyStats(content, stat_type)
 		return content
 
+	def get_account_stats(self, stat_type=FastlyStatsType.ALL, services=None, parallelism=FASTLY_POOL_SIZE, start=None, end=None):
+		"""Get the stats of many services, by default every service of the account, concurrently. Returns a dict with the FastlyStats of each service under "services", their sum aligned on timestamps under "total", and the exception raised for each service whose stats could not be fetched under "errors"."""
+		if services is None:
+			services = self.list_services()
+		service_ids = [getattr(service, "id", service) for service in services]
+
+		workers = FastlyWorkerPool(parallelism)
+		try:
+			futures = [(service_id, workers.submit(self.get_stats, service_id, stat_type, True, start, end)) for service_id in service_ids]
+			results = {}
+			errors = {}
+			for service_id, future in futures:
+				error = future.exception()
+				if error is not None:
+					errors[service_id] = error
+				else:
+					results[service_id] = future.result()
+		finally:
+			workers.shutdown()
+
+		return {
+			"services": results,
+			"total": FastlyStats.merge(results.values(), stat_type),
+			"errors": errors,
+		}
+
+	def inventory(self, services=None, parallelism=FASTLY_POOL_SIZE, progress=None):
+		"""Load the active configuration of many services, by default every service of the account, on a pool of parallelism workers. progress, if given, is called as progress(done, total, service_id) as each service completes. Requests in flight are also bounded by the pool_size of the connection. Returns a FastlyInventory."""
+		if services is None:
+			services = self.list_services()
+		services = [service if isinstance(service, FastlyService) else FastlyService(self, {"id": service}) for service in services]
+
+		inventory = FastlyInventory()
+		completed = Queue.Queue()
+
+		def load(service):
+			try:
+				completed.put((service, self.get_version_snapshot(service.id)))
+			except Exception as e:
+				completed.put((service, e))
+
+		workers = FastlyWorkerPool(parallelism)
+		try:
+			for service in services:
+				workers.submit(load, service)
+			# Collected in completion order, so a slow service holds nothing back.
+			for done in range(len(services)):
+				service, version = completed.get()
+				inventory.add(service, version)
+				if progress is not None:
+					progress(done + 1, len(services), service.id)
+		finally:
+			workers.shutdown()
+		return inventory
+
 	def list_syslogs(self, service_id, version_number):
 		"""List all of the Syslogs for a particular service and version."""
 		content = self._fetch("/service/%s/version/%d/syslog" % (service_id, version_number))
 		return map(lambda x: FastlySyslog(self, x), content)
 
+	def iter_syslogs(self, service_id, version_number):
+		"""Like list_syslogs, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/syslog" % (service_id, version_number))
+		return (FastlySyslog(self, x) for x in content)
+
 	def create_syslog(
 		self,
 		service_id,
@@ -830,6 +2041,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/vcl" % (service_id, version_number))
 		return map(lambda x: FastlyVCL(self, x), content)
 
+	def iter_vcls(self, service_id, version_number):
+		"""Like list_vcls, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/vcl" % (service_id, version_number))
+		return (FastlyVCL(self, x) for x in content)
+
 	def upload_vcl(self, service_id, version_number, name, content, main=None, comment=None):
 		"""Upload a VCL for a particular service and version."""
 		body = self._formdata({
@@ -843,12 +2059,22 @@ class FastlyConnection(object):
 
 	def download_vcl(self, service_id, version_number, name):
 		"""Download the specified VCL."""
-		# TODO: Not sure what to do here, the documentation shows invalid response. Will have to test.
-		raise Exception("Not implemented")
+		return self.get_vcl(service_id, version_number, name).content
 
 	def get_vcl(self, service_id, version_number, name, include_content=True):
-		"""Get the uploaded VCL for a particular service and version."""
-		content = self._fetch("/service/%s/version/%d/vcl/%s?include_content=%d" % (service_id, version_number, urllib.quote(name, safe=''), int(include_content)))
+		"""Get the uploaded VCL for a particular service and version. With a vcl_cache, VCLs of locked versions are served from disk, and otherwise the content is only downloaded when its md5 is not already cached."""
+		url = "/service/%s/version/%d/vcl/%s?include_content=%%d" % (service_id, version_number, urllib.quote(name, safe=''))
+		if self._vcl_cache is None or not include_content:
+			content = self._fetch(url % int(include_content))
+			return FastlyVCL(self, content)
+
+		content = self._vcl_cache.get_vcl(service_id, version_number, name)
+		if content is None:
+			content = dict(self._fetch(url % 0))
+			content["content"] = self._vcl_cache.get_body(content.get("md5"))
+			if content["content"] is None:
+				content = self._fetch(url % 1)
+			self._vcl_cache.put_vcl(service_id, version_number, name, content)
 		return FastlyVCL(self, content)
 
 	def get_vcl_html(self, service_id, version_number, name):
@@ -857,8 +2083,14 @@ class FastlyConnection(object):
 		return content.get("content", None)
 
 	def get_generated_vcl(self, service_id, version_number):
-		"""Display the generated VCL for a particular service and version."""
+		"""Display the generated VCL for a particular service and version. With a vcl_cache, the generated VCL of locked versions is served from disk."""
+		if self._vcl_cache is not None:
+			content = self._vcl_cache.get_vcl(service_id, version_number)
+			if content is not None:
+				return FastlyVCL(self, content)
 		content = self._fetch("/service/%s/version/%d/generated_vcl" % (service_id, version_number))
+		if self._vcl_cache is not None:
+			self._vcl_cache.put_vcl(service_id, version_number, None, content)
 		return FastlyVCL(self, content)
 
 	def get_generated_vcl_html(self, service_id, version_number):
@@ -896,11 +2128,212 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version" % service_id)
 		return map(lambda x: FastlyVersion(self, x), content)
 
+	def iter_versions(self, service_id):
+		"""Like list_versions, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version" % service_id)
+		return (FastlyVersion(self, x) for x in content)
+
 	def get_version(self, service_id, version_number):
 		"""Get the version for a particular service."""
 		content = self._fetch("/service/%s/version/%d" % (service_id, version_number))
 		return FastlyVersion(self, content)
 
+	def get_version_snapshot(self, service_id, version_number=None, parallelism=FASTLY_POOL_SIZE):
+		"""Get a version, by default the active one, with all of its components loaded. The service details for the version provide most components in one request, and any the details leave out are listed in parallel."""
+		if version_number is None:
+			content = self._fetch("/service/%s/details" % service_id)
+			data = content.get("version") or {}
+			if "number" not in data:
+				raise FastlyNoActiveVersionError(service_id)
+			version_number = int(data["number"])
+		else:
+			content = self._fetch("/service/%s/details?version=%d" % (service_id, version_number))
+			data = content.get("version") or {}
+			if str(data.get("number")) != str(version_number):
+				data = self._fetch("/service/%s/version/%d" % (service_id, version_number))
+
+		version = FastlyVersion(self, dict([(k, v) for k, v in data.items() if k in FastlyVersion.FIELDS]))
+		missing = []
+		for name, (method, cls, key, path) in FASTLY_VERSION_COMPONENTS.items():
+			if not isinstance(data.get(key), list):
+				missing.append(name)
+				continue
+			items = []
+			for item in data[key]:
+				item.setdefault("service_id", service_id)
+				item.setdefault("version", version_number)
+				items.append(cls(self, item))
+			version._components[name] = dict([(item.name, item) for item in items])
+
+		if len(missing) == 1:
+			name = missing[0]
+			version._components[name] = dict([(item.name, item) for item in getattr(self, FASTLY_VERSION_COMPONENTS[name][0])(service_id, version_number)])
+		elif missing:
+			workers = FastlyWorkerPool(min(parallelism, len(missing)))
+			try:
+				futures = [(name, workers.submit(getattr(self, FASTLY_VERSION_COMPONENTS[name][0]), service_id, version_number)) for name in missing]
+				for name, future in futures:
+					version._components[name] = dict([(item.name, item) for item in future.result()])
+			finally:
+				workers.shutdown()
+		return version
+
+	def diff_versions(self, service_id, a, b):
+		"""Compare the configuration of versions a and b of a service. Both versions are loaded concurrently and objects are matched by name. Returns a dict keyed on component name, holding only components that differ, each a dict with "added" and "removed" objects by name and "changed" field-level differences as {name: {field: (value_in_a, value_in_b)}}. VCLs are compared by md5, and the content of both sides is only downloaded when the md5s differ."""
+		workers = FastlyWorkerPool(2)
+		try:
+			future_a = workers.submit(self.get_version_snapshot, service_id, a)
+			future_b = workers.submit(self.get_version_snapshot, service_id, b)
+			version_a, version_b = future_a.result(), future_b.result()
+		finally:
+			workers.shutdown()
+
+		diff = {}
+		for name in FASTLY_VERSION_COMPONENTS:
+			changes = self._diff_components(version_a._component(name), version_b._component(name), name == "vcls")
+			if changes["added"] or changes["removed"] or changes["changed"]:
+				diff[name] = changes
+
+		vcls = diff.get("vcls", {}).get("changed", {})
+		if vcls:
+			workers = FastlyWorkerPool(FASTLY_POOL_SIZE)
+			try:
+				futures = [(vcl_name, workers.submit(self.get_vcl, service_id, a, vcl_name), workers.submit(self.get_vcl, service_id, b, vcl_name)) for vcl_name, fields in vcls.items() if "md5" in fields]
+				for vcl_name, future_a, future_b in futures:
+					vcls[vcl_name]["content"] = (future_a.result().content, future_b.result().content)
+			finally:
+				workers.shutdown()
+		return diff
+
+	def plan(self, service_id, desired_config, version_number=None):
+		"""List the calls needed to bring a version, by default the active one, to desired_config. desired_config maps component names from FASTLY_VERSION_COMPONENTS to lists of dicts of API fields, each with a "name". Only the components it lists are managed, and only the fields given are compared. Directors may list the names of their backends under "backends". Returns a (version, steps) tuple where each step is a dict with "action", "component", "name" and the "fields" to send."""
+		version = self.get_version_snapshot(service_id, version_number)
+		steps = []
+		for component, desired in desired_config.items():
+			if component not in FASTLY_VERSION_COMPONENTS:
+				raise FastlyError("Unknown component %s." % component)
+			current = version._component(component)
+			desired = dict([(item["name"], item) for item in desired])
+			for name in set(current) - set(desired):
+				steps.append({"action": "delete", "component": component, "name": name, "fields": {}})
+			for name, item in desired.items():
+				fields = dict([(k, v) for k, v in item.items() if k != "backends"])
+				if name not in current:
+					steps.append({"action": "create", "component": component, "name": name, "fields": fields})
+				else:
+					changed = self._changed_fields(current[name], fields)
+					if changed:
+						steps.append({"action": "update", "component": component, "name": name, "fields": changed})
+				if component == "directors" and "backends" in item:
+					attached = set(current[name].backends or []) if name in current else set()
+					for backend in set(item["backends"]) - attached:
+						steps.append({"action": "attach", "component": component, "name": name, "fields": {"backend": backend}})
+					for backend in attached - set(item["backends"]):
+						steps.append({"action": "detach", "component": component, "name": name, "fields": {"backend": backend}})
+		steps.sort(key=self._apply_stage)
+		return (version, steps)
+
+	def apply(self, service_id, desired_config, activate=False, parallelism=FASTLY_POOL_SIZE):
+		"""Bring a service to desired_config, as described by plan(). When anything differs, the active version is cloned once, only the planned calls are made on the clone, and the clone is validated and optionally activated. Steps run concurrently, except that conditions and healthchecks are written before the objects referring to them, backends before directors, and deletions of referenced objects last. Returns the version holding the desired configuration. If a stage fails, later stages are not run and a FastlyApplyError naming the partly configured clone is raised."""
+		active, steps = self.plan(service_id, desired_config)
+		if not steps:
+			return active
+
+		version = self.clone_version(service_id, int(active.number))
+		version_number = int(version.number)
+		workers = FastlyWorkerPool(parallelism)
+		try:
+			stage_steps = []
+			for i, step in enumerate(steps):
+				stage_steps.append(step)
+				if i + 1 < len(steps) and self._apply_stage(steps[i + 1]) == self._apply_stage(step):
+					continue
+				futures = [(stage_step, workers.submit(self._apply_step, service_id, version_number, stage_step)) for stage_step in stage_steps]
+				errors = [(stage_step, future.exception()) for stage_step, future in futures]
+				errors = [(stage_step, error) for stage_step, error in errors if error is not None]
+				if errors:
+					raise FastlyApplyError(service_id, version_number, errors)
+				stage_steps = []
+		finally:
+			workers.shutdown()
+
+		self.validate_version(service_id, version_number)
+		if activate:
+			version = self.activate_version(service_id, version_number)
+		return version
+
+	def _apply_stage(self, step):
+		action, component = step["action"], step["component"]
+		referenced = ["conditions", "healthchecks"]
+		if action in ["delete", "detach"] and component == "directors":
+			return 0
+		if action in ["create", "update"] and component in referenced:
+			return 1
+		if action in ["create", "update"] and component == "directors":
+			return 3
+		if action == "attach":
+			return 4
+		if action == "delete" and component == "backends":
+			return 5
+		if action == "delete" and component in referenced:
+			return 6
+		return 2
+
+	def _apply_step(self, service_id, version_number, step):
+		method, cls, key, path = FASTLY_VERSION_COMPONENTS[step["component"]]
+		url = "/service/%s/version/%d/%s" % (service_id, version_number, path)
+		name = urllib.quote(step["name"], safe='')
+		if step["action"] == "create":
+			return self._fetch(url, method="POST", body=self._formdata(step["fields"], cls.FIELDS))
+		if step["action"] == "update":
+			return self._fetch("%s/%s" % (url, name), method="PUT", body=self._formdata(step["fields"], cls.FIELDS))
+		if step["action"] == "delete":
+			return self._status(self._fetch("%s/%s" % (url, name), method="DELETE"))
+		if step["action"] == "attach":
+			return self.create_director_backend(service_id, version_number, step["name"], step["fields"]["backend"])
+		if step["action"] == "detach":
+			return self.delete_director_backend(service_id, version_number, step["name"], step["fields"]["backend"])
+
+	def _changed_fields(self, current, fields):
+		data = current._data
+		changed = {}
+		for field, value in fields.items():
+			if field == "content" and isinstance(current, FastlyVCL) and current.md5:
+				if isinstance(value, unicode):
+					value = value.encode("utf-8")
+				if hashlib.md5(value).hexdigest() != current.md5:
+					changed[field] = value
+			elif self._normalize(value) != self._normalize(data.get(field)):
+				changed[field] = value
+		return changed
+
+	def _normalize(self, value):
+		if isinstance(value, bool):
+			value = int(value)
+		if value is None:
+			return None
+		return unicode(value)
+
+	def _diff_components(self, a, b, by_md5=False):
+		ignored = ["service_id", "version", "created_at", "updated_at", "deleted_at", "created", "updated", "deleted"]
+		if by_md5:
+			# The md5 stands in for the content, fetched only when it differs.
+			ignored.append("content")
+		changed = {}
+		for name in set(a) & set(b):
+			data_a, data_b = a[name]._data, b[name]._data
+			fields = {}
+			for field in set(data_a) | set(data_b):
+				if field not in ignored and data_a.get(field) != data_b.get(field):
+					fields[field] = (data_a.get(field), data_b.get(field))
+			if fields:
+				changed[name] = fields
+		return {
+			"added": dict([(name, b[name]) for name in set(b) - set(a)]),
+			"removed": dict([(name, a[name]) for name in set(a) - set(b)]),
+			"changed": changed,
+		}
+
 	def update_version(self, service_id, version_number, **kwargs):
 		"""Update a particular version for a particular service."""
 		body = self._formdata(kwargs, FastlyVersion.FIELDS)
@@ -937,6 +2370,11 @@ class FastlyConnection(object):
 		content = self._fetch("/service/%s/version/%d/wordpress" % (service_id, version_number))
 		return map(lambda x: FastlyWordpress(self, x), content)
 
+	def iter_wordpressess(self, service_id, version_number):
+		"""Like list_wordpressess, but decodes and yields one object at a time."""
+		content = self._fetch_iter("/service/%s/version/%d/wordpress" % (service_id, version_number))
+		return (FastlyWordpress(self, x) for x in content)
+
 	def create_wordpress(
 		self,
 		service_id,
@@ -993,12 +2431,29 @@ class FastlyConnection(object):
 		return urllib.urlencode(data)
 
 	def _fetch(self, url, method="GET", body=None, headers={}):
+		if self._cache is not None:
+			if method == "GET":
+				hit, payload = self._cache.get(url)
+				if hit:
+					return payload
+				payload = self._request(url, method, body, headers)
+				self._cache.put(url, payload)
+				return payload
+			if method != "PURGE" and not FASTLY_PURGE_PATH_REGEX.match(url):
+				try:
+					return self._request(url, method, body, headers)
+				finally:
+					self._cache.invalidate(url)
+		return self._request(url, method, body, headers)
+
+	def _fetch_iter(self, url):
+		"""GET a JSON array and return an iterator decoding it one element at a time, so only the raw body and the current element are held in memory. Bypasses the response cache and conditional requests, which keep the whole decoded payload."""
+		return self._request(url, "GET", None, {}, stream=True)
+
+	def _request(self, url, method, body, headers, stream=False):
 		hdrs = {}
 		hdrs.update(headers)
-		
-		print("Fetch: %s %s" % (method, url))
-		if body:
-			print("Body: %s" % body)
+
 		if self._fully_authed:
 			hdrs["Cookie"] = self._session
 		else:
@@ -1009,12 +2464,115 @@ class FastlyConnection(object):
 		if "Content-Type" not in hdrs and method in ["POST", "PUT"]:
 			hdrs["Content-Type"] = "application/x-www-form-urlencoded"
 
-		conn = httplib2.Http(disable_ssl_certificate_validation=False, timeout=10)
-		endpoint = "%s://%s%s" % (FASTLY_SCHEME, FASTLY_HOST, url)
-		return self._check(*conn.request(endpoint, method, body=body, headers=hdrs))
+		conditional, cached = ({}, None)
+		if method == "GET" and not stream and self._validators is not None:
+			conditional, cached = self._validators.conditional(url)
+			hdrs.update(conditional)
+
+		# Reads and purges do not count against the API rate limit.
+		rate_limited = self._rate_limiter is not None and method not in ["GET", "PURGE"] and not FASTLY_PURGE_PATH_REGEX.match(url)
 
-	def _check(self, resp, content):
+		endpoint = "%s://%s%s" % (FASTLY_SCHEME, FASTLY_HOST, url)
+		self._retry_policy.started()
+		attempt = 0
+		failed = False
+		while True:
+			if rate_limited:
+				self._rate_limiter.acquire()
+			self._count("requests")
+			try:
+				if self._hooks:
+					resp, content = self._traced_request(url, endpoint, method, body, hdrs)
+				else:
+					resp, content = self._transport.request(endpoint, method, body=body, headers=hdrs)
+			except (socket.error, httplib.HTTPException):
+				delay = self._retry_policy.delay(method, attempt, url=url)
+				if delay is None:
+					self._count("failures")
+					raise
+			else:
+				if rate_limited and "fastly-ratelimit-remaining" in resp and "fastly-ratelimit-reset" in resp:
+					try:
+						self._rate_limiter.update(int(resp["fastly-ratelimit-remaining"]), int(resp["fastly-ratelimit-reset"]))
+					except ValueError:
+						pass
+				if resp.status < 400:
+					break
+				delay = self._retry_policy.delay(method, attempt, resp.status, resp.get("retry-after"), url)
+				if delay is None:
+					failed = True
+					break
+			self._count("retries")
+			time.sleep(delay)
+			attempt += 1
+
+		if failed:
+			# A stored session may have expired since it was saved.
+			if resp.status == 401 and self._reused_session and hdrs.get("Cookie") is not None:
+				self._relogin(hdrs["Cookie"])
+				return self._request(url, method, body, headers, stream)
+			self._count("failures")
+
+		if method != "GET" or stream:
+			return self._check(resp, content, stream)
+		if resp.status == 304 and conditional:
+			self._validators.revalidated(url)
+			return cached
+		payload = self._check(resp, content)
+		if self._validators is not None:
+			self._validators.put(url, resp, payload)
+		if self._vcl_cache is not None:
+			self._vcl_cache.observe(url, payload)
+		return payload
+
+	def _count(self, name):
+		with self._stats_lock:
+			self._stats[name] += 1
+
+	def _traced_request(self, url, endpoint, method, body, hdrs):
+		status = None
+		content = None
+		start = time.time()
+		try:
+			resp, content = self._transport.request(endpoint, method, body=body, headers=hdrs)
+			status = resp.status
+			return (resp, content)
+		finally:
+			latency = time.time() - start
+			for hook in self._hooks:
+				hook(method, url, status, latency, len(body or ""), len(content or ""))
+
+	def _iter_array(self, content):
+		decoder = json.JSONDecoder()
+		whitespace = re.compile(r"\s*")
+		idx = whitespace.match(content).end()
+		if content[idx:idx + 1] != "[":
+			raise FastlyError("Expected a JSON array.")
+		idx = whitespace.match(content, idx + 1).end()
+		if content[idx:idx + 1] != "]":
+			while True:
+				try:
+					value, idx = decoder.raw_decode(content, idx)
+				except ValueError:
+					raise self._malformed_array(content, idx)
+				yield value
+				idx = whitespace.match(content, idx).end()
+				if content[idx:idx + 1] == "]":
+					break
+				if content[idx:idx + 1] != ",":
+					raise self._malformed_array(content, idx)
+				idx = whitespace.match(content, idx + 1).end()
+		if whitespace.match(content, idx + 1).end() != len(content):
+			raise self._malformed_array(content, idx + 1)
+
+	def _malformed_array(self, content, idx):
+		return FastlyError("Malformed or truncated JSON array at offset %d of %d." % (idx, len(content)))
+
+	def _check(self, resp, content, stream=False):
 		status = resp.status
+		if stream and status == 200:
+			return self._iter_array(content)
+
 		payload = None
 		if content:
 			try:
@@ -1042,7 +2600,44 @@ class FastlyConnection(object):
 			raise FastlyError(status)
 
 
+class AsyncFastlyConnection(object):
+	"""Runs FastlyConnection calls concurrently. Every public method of FastlyConnection is available under the same name and returns a FastlyFuture resolving to what the blocking call would have returned. At most concurrency requests are in flight at once."""
+
+	def __init__(self, api_key, concurrency=FASTLY_POOL_SIZE, backlog=0, **kwargs):
+		kwargs.setdefault("pool_size", concurrency)
+		self._conn = FastlyConnection(api_key, **kwargs)
+		self._workers = FastlyWorkerPool(concurrency, backlog)
+
+	@property
+	def connection(self):
+		"""The blocking FastlyConnection used to make the requests."""
+		return self._conn
+
+	@property
+	def fully_authed(self):
+		return self._conn.fully_authed
+
+	def close(self):
+		self._workers.shutdown()
+		self._conn.close()
+
+	def __getattr__(self, name):
+		# Looked up on the class, so properties such as purge_queue never run.
+		attr = getattr(type(self._conn), name, None)
+		if name.startswith("_") or not isinstance(attr, types.MethodType):
+			raise AttributeError(name)
+		method = getattr(self._conn, name)
+
+		def submit(*args, **kwargs):
+			return self._workers.submit(method, *args, **kwargs)
+		submit.__name__ = name
+		submit.__doc__ = method.__doc__
+		return submit
+
+
 class IDateStampedObject(object):
+	__slots__ = ()
+
 	@property
 	def created_date(self):
 		if hasattr(self, "created_at"):
@@ -1066,27 +2661,82 @@ class IDateStampedObject(object):
 
 
 class IServiceObject(object):
+	__slots__ = ()
+
 	@property
 	def service(self):
 		return self._conn.get_service(self.service_id)
 
 
 class IServiceVersionObject(IServiceObject):
+	__slots__ = ()
+
 	@property
 	def service_version(self):
 		return self._conn.get_service_version(self.service_id, self.version)
 
 
+class FastlyObjectType(type):
+	"""Builds FastlyObject classes as slotted classes. Each name in FIELDS becomes a slot read directly through its member descriptor, unless the class already defines an attribute by that name, such as a property wrapping the raw value. Values for those names, and keys outside of FIELDS, are kept in a per-instance dict that is only allocated when needed."""
+
+	def __new__(meta, name, bases, attrs):
+		fields = attrs.get("FIELDS", [])
+		slots = []
+		for field in fields:
+			if field not in attrs and field not in slots and not any(hasattr(base, field) for base in bases):
+				slots.append(field)
+		attrs["__slots__"] = tuple(attrs.get("__slots__", ())) + tuple(slots)
+		cls = type.__new__(meta, name, bases, attrs)
+
+		inherited = getattr(cls, "_slot_descriptors", ())
+		cls._slot_descriptors = inherited + tuple((field, cls.__dict__[field]) for field in slots)
+		cls._slot_fields = frozenset(field for field, descriptor in cls._slot_descriptors)
+		cls._fields = frozenset(fields) | getattr(cls, "_fields", frozenset())
+		return cls
+
+
 class FastlyObject(object):
+	__metaclass__ = FastlyObjectType
+	__slots__ = ("_conn", "_extra")
+
 	def __init__(self, conn, data):  
 		self._conn = conn
-		self._data = data or {}
+		self._extra = None
+		data = data or {}
+		if not isinstance(data, dict):
+			self._extra = data
+			return
+		slot_fields = self._slot_fields
+		for key, value in data.iteritems():
+			if key in slot_fields:
+				setattr(self, key, value)
+			else:
+				if self._extra is None:
+					self._extra = {}
+				self._extra[key] = value
 
 	def __getattr__(self, name):
-		cls = self.__class__
-		if name in cls.FIELDS:
-			return self._data.get(name, None)
-		raise AttributeError()
+		if name in ("_conn", "_extra"):
+			raise AttributeError(name)
+		extra = self._extra
+		if isinstance(extra, dict) and name in extra:
+			return extra[name]
+		if name in self._fields:
+			return None
+		raise AttributeError(name)
+
+	@property
+	def _data(self):
+		"""The decoded payload this object was built from."""
+		if self._extra is not None and not isinstance(self._extra, dict):
+			return self._extra
+		data = dict(self._extra or {})
+		for name, descriptor in self._slot_descriptors:
+			try:
+				data[name] = descriptor.__get__(self)
+			except AttributeError:
+				pass
+		return data
 
 	def __str__(self):
 		return str(self._data)
@@ -1114,6 +2764,25 @@ class FastlyError(Exception):
 		Exception.__init__(self, status)
 
 
+class FastlyApplyError(FastlyError):
+	"""Raised by apply() when steps of a stage fail. The clone is left partly configured, version_number is its number, and errors holds a (step, exception) pair for every step of the stage that failed."""
+
+	def __init__(self, service_id, version_number, errors):
+		failures = "; ".join(["%s %s %s: %s" % (step["action"], step["component"], step["name"], error) for step, error in errors])
+		FastlyError.__init__(self, "Applying version %d of service %s failed: %s" % (version_number, service_id, failures))
+		self.service_id = service_id
+		self.version_number = version_number
+		self.errors = errors
+
+
+class FastlyNoActiveVersionError(FastlyError):
+	"""Raised by get_version_snapshot() when asked for the active version of a service that has none."""
+
+	def __init__(self, service_id):
+		FastlyError.__init__(self, "Service %s has no active version." % service_id)
+		self.service_id = service_id
+
+
 class FastlySession(FastlyObject):
 	FIELDS = []
 
@@ -1492,6 +3161,11 @@ class FastlyVersion(FastlyObject, IServiceObject, IDateStampedObject):
 		"deployed",
 		"inherit_service_id",
 	]
+	__slots__ = ("_components",)
+
+	def __init__(self, conn, data):
+		FastlyObject.__init__(self, conn, data)
+		self._components = {}
 
 	@property
 	def settings(self):
@@ -1503,19 +3177,19 @@ class FastlyVersion(FastlyObject, IServiceObject, IDateStampedObject):
 
 	@property
 	def backends(self):
-		return dict([(b.name, b) for b in self._conn.list_backends(self.service_id, int(self.number))])
+		return self._component("backends")
 
 	@property
 	def healthchecks(self):
-		return dict([(h.name, h) for h in self._conn.list_healthchecks(self.service_id, int(self.number))])
+		return self._component("healthchecks")
 
 	@property
 	def domains(self):
-		return dict([(d.name, d) for d in self._conn.list_domains(self.service_id, int(self.number))])
+		return self._component("domains")
 
 	@property
 	def directors(self):
-		return dict([(d.name, d) for d in self._conn.list_directors(self.service_id, int(self.number))])
+		return self._component("directors")
 
 	@property
 	def origins(self):
@@ -1523,11 +3197,54 @@ class FastlyVersion(FastlyObject, IServiceObject, IDateStampedObject):
 
 	@property
 	def syslogs(self):
-		return dict([(s.name, s) for s in self._conn.list_syslogs(self.service_id, int(self.number))])
+		return self._component("syslogs")
 
 	@property
 	def vcls(self):
-		return dict([(v.name, v) for v in self._conn.list_vcls(self.service_id, int(self.number))])
+		return self._component("vcls")
+
+	@property
+	def conditions(self):
+		return self._component("conditions")
+
+	@property
+	def headers(self):
+		return self._component("headers")
+
+	@property
+	def cache_settings(self):
+		return self._component("cache_settings")
+
+	@property
+	def request_settings(self):
+		return self._component("request_settings")
+
+	@property
+	def response_objects(self):
+		return self._component("response_objects")
+
+	@property
+	def gzips(self):
+		return self._component("gzips")
+
+	@property
+	def wordpresses(self):
+		return self._component("wordpresses")
+
+	def snapshot(self):
+		"""Load every component of this version in as few requests as possible. The component properties are then served from memory until the next snapshot."""
+		snapshot = self._conn.get_version_snapshot(self.service_id, int(self.number))
+		self._components = snapshot._components
+		return self
+
+	def _component(self, name):
+		"""Returns a dict of the named component by name, fetched on first access and then memoized."""
+		components = self._components.get(name)
+		if components is None:
+			method = FASTLY_VERSION_COMPONENTS[name][0]
+			items = getattr(self._conn, method)(self.service_id, int(self.number))
+			components = self._components[name] = dict([(item.name, item) for item in items])
+		return components
 
 
 class FastlyWordpress(FastlyObject, IServiceVersionObject):
@@ -1541,8 +3258,450 @@ class FastlyWordpress(FastlyObject, IServiceVersionObject):
 	]
 
 
-def connect(api_key, username=None, password=None):
-	conn = FastlyConnection(api_key)
+class FastlyStats(object):
+	"""Stats samples held as columns: a timestamps array plus one array of floats per numeric metric, sorted by time. Columns are NumPy arrays when NumPy is installed and array.array("d") otherwise, and the aggregations use NumPy when it is available."""
+
+	TIMESTAMP_FIELDS = ["start_time", "timestamp", "time"]
+
+	def __init__(self, data, stat_type=FastlyStatsType.ALL, period=None):
+		self.stat_type = stat_type
+		self.period = period or getattr(FastlyStatsPeriod, str(stat_type).upper(), None)
+		if isinstance(data, dict) and "timestamps" in data:
+			timestamps, columns = data["timestamps"], data["columns"]
+		else:
+			timestamps, columns = self._columns(data)
+		self.timestamps = self._array(timestamps)
+		self.columns = dict([(name, self._array(values)) for name, values in columns.items()])
+
+	@property
+	def metrics(self):
+		return sorted(self.columns)
+
+	def __len__(self):
+		return len(self.timestamps)
+
+	def __getitem__(self, metric):
+		return self.columns[metric]
+
+	def sum(self, metric):
+		column = self.columns[metric]
+		if numpy is not None:
+			return float(numpy.sum(column))
+		return sum(column)
+
+	def rate(self, metric):
+		"""The per second rate of metric in each sample."""
+		if not self.period:
+			raise FastlyError("The sample period of %s stats is unknown." % self.stat_type)
+		column = self.columns[metric]
+		if numpy is not None:
+			return column / float(self.period)
+		return array.array("d", [value / self.period for value in column])
+
+	def percentile(self, metric, q):
+		"""The q-th percentile, from 0 to 100, of metric over the samples, interpolating linearly."""
+		column = self.columns[metric]
+		if not len(column):
+			return None
+		if numpy is not None:
+			return float(numpy.percentile(column, q))
+		values = sorted(column)
+		position = (len(values) - 1) * q / 100.0
+		lower = int(position)
+		upper = min(lower + 1, len(values) - 1)
+		return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+	def resample(self, period):
+		"""Sum the samples into buckets of period seconds, returning a new FastlyStats."""
+		if numpy is not None:
+			buckets = self.timestamps - self.timestamps % period
+			keys, index = numpy.unique(buckets, return_inverse=True)
+			columns = dict([(name, numpy.bincount(index, weights=column, minlength=len(keys))) for name, column in self.columns.items()])
+			return FastlyStats({"timestamps": keys, "columns": columns}, self.stat_type, period)
+
+		keys = []
+		columns = dict([(name, []) for name in self.columns])
+		for i, timestamp in enumerate(self.timestamps):
+			bucket = timestamp - timestamp % period
+			if not keys or keys[-1] != bucket:
+				keys.append(bucket)
+				for values in columns.values():
+					values.append(0.0)
+			for name, values in columns.items():
+				values[-1] += self.columns[name][i]
+		return FastlyStats({"timestamps": keys, "columns": columns}, self.stat_type, period)
+
+	@classmethod
+	def merge(cls, stats, stat_type=FastlyStatsType.ALL):
+		"""Align several FastlyStats on their timestamps and sum them into one. A metric missing from some of them counts as zero there."""
+		names = set()
+		for item in stats:
+			names.update(item.columns)
+		period = stats[0].period if stats else None
+
+		if numpy is not None:
+			timestamps = numpy.concatenate([item.timestamps for item in stats] or [numpy.zeros(0)])
+			keys, index = numpy.unique(timestamps, return_inverse=True)
+			columns = {}
+			for name in names:
+				values = numpy.concatenate([item.columns.get(name, numpy.zeros(len(item))) for item in stats])
+				columns[name] = numpy.bincount(index, weights=values, minlength=len(keys))
+			return cls({"timestamps": keys, "columns": columns}, stat_type, period)
+
+		totals = {}
+		for item in stats:
+			for i, timestamp in enumerate(item.timestamps):
+				row = totals.setdefault(timestamp, dict([(name, 0.0) for name in names]))
+				for name, column in item.columns.items():
+					row[name] += column[i]
+		keys = sorted(totals)
+		columns = dict([(name, [totals[key][name] for key in keys]) for name in names])
+		return cls({"timestamps": keys, "columns": columns}, stat_type, period)
+
+	def between(self, start, end):
+		"""The samples with start <= timestamp < end, as a new FastlyStats."""
+		lower = bisect.bisect_left(self.timestamps, start)
+		upper = bisect.bisect_left(self.timestamps, end)
+		columns = dict([(name, column[lower:upper]) for name, column in self.columns.items()])
+		return FastlyStats({"timestamps": self.timestamps[lower:upper], "columns": columns}, self.stat_type, self.period)
+
+	def _array(self, values):
+		if numpy is not None:
+			return numpy.asarray(values, dtype=float)
+		return array.array("d", values)
+
+	def _columns(self, data):
+		if isinstance(data, dict):
+			data = data.get("data", [])
+		records = []
+		for record in data or []:
+			timestamp = None
+			for field in self.TIMESTAMP_FIELDS:
+				if record.get(field) is not None:
+					timestamp = float(record[field])
+					break
+			if timestamp is not None:
+				records.append((timestamp, record))
+		records.sort(key=lambda r: r[0])
+
+		names = set()
+		for timestamp, record in records:
+			for name, value in record.items():
+				if name not in self.TIMESTAMP_FIELDS and isinstance(value, (int, long, float)) and not isinstance(value, bool):
+					names.add(name)
+		columns = dict([(name, [float(record.get(name) or 0) for timestamp, record in records]) for name in names])
+		return ([timestamp for timestamp, record in records], columns)
+
+
+class FastlyStatsStore(object):
+	"""Keeps the stats samples of each service and granularity in a SQLite file under directory, along with the time ranges already fetched. A query only requests the parts of its range not stored yet and then reads from the file. Stats can arrive late, so ranges ending less than settle seconds ago are fetched again by later queries instead of being recorded as complete."""
+
+	def __init__(self, conn, directory, settle=FASTLY_STATS_SETTLE):
+		self._conn = conn
+		self.directory = directory
+		self.settle = settle
+		self._lock = threading.Lock()
+		self._file_locks = {}
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+	def query(self, service_id, stat_type, start, end):
+		"""Returns a FastlyStats with the samples of a service in start <= t < end, fetching missing ranges first."""
+		period = getattr(FastlyStatsPeriod, str(stat_type).upper(), None)
+		if period is None:
+			raise FastlyError("Stats of type %s cannot be stored." % stat_type)
+		start = int(start) - int(start) % period
+		end = int(end) + (-int(end)) % period
+
+		path = os.path.join(self.directory, "%s-%s.sqlite" % (urllib.quote(str(service_id), safe=''), stat_type))
+		with self._lock:
+			file_lock = self._file_locks.setdefault(path, threading.Lock())
+		with file_lock:
+			db = self._open(path)
+			try:
+				for gap_start, gap_end in self._gaps(db, start, end):
+					self._fill(db, service_id, stat_type, period, gap_start, gap_end)
+				rows = db.execute("SELECT data FROM samples WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp", (start, end)).fetchall()
+			finally:
+				db.close()
+		return FastlyStats([json.loads(row[0]) for row in rows], stat_type)
+
+	def _open(self, path):
+		db = sqlite3.connect(path)
+		db.execute("CREATE TABLE IF NOT EXISTS samples (timestamp INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+		db.execute("CREATE TABLE IF NOT EXISTS ranges (start INTEGER NOT NULL, end INTEGER NOT NULL)")
+		return db
+
+	def _gaps(self, db, start, end):
+		gaps = []
+		cursor = start
+		for range_start, range_end in db.execute("SELECT start, end FROM ranges WHERE end > ? AND start < ? ORDER BY start", (start, end)):
+			if range_start > cursor:
+				gaps.append((cursor, range_start))
+			cursor = max(cursor, range_end)
+		if cursor < end:
+			gaps.append((cursor, end))
+		return gaps
+
+	def _fill(self, db, service_id, stat_type, period, start, end):
+		content = self._conn.get_stats(service_id, stat_type, start=start, end=end)
+		records = content.get("data", []) if isinstance(content, dict) else content
+		with db:
+			for record in records or []:
+				for field in FastlyStats.TIMESTAMP_FIELDS:
+					if record.get(field) is not None:
+						db.execute("INSERT OR REPLACE INTO samples (timestamp, data) VALUES (?, ?)", (int(float(record[field])), json.dumps(record)))
+						break
+			# Recent periods may still be accumulating or delayed, so they stay a gap.
+			settled = int(time.time() - self.settle)
+			complete = min(end, settled - settled % period)
+			if complete > start:
+				self._add_range(db, start, complete)
+
+	def _add_range(self, db, start, end):
+		ranges = db.execute("SELECT start, end FROM ranges ORDER BY start").fetchall() + [(start, end)]
+		ranges.sort()
+		merged = []
+		for range_start, range_end in ranges:
+			if merged and range_start <= merged[-1][1]:
+				merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+			else:
+				merged.append((range_start, range_end))
+		db.execute("DELETE FROM ranges")
+		db.executemany("INSERT INTO ranges (start, end) VALUES (?, ?)", merged)
+
+
+class FastlyInventory(object):
+	"""The services of an account with their active versions, each holding all of its components. services and versions are keyed on service id, a service without an active version maps to None, and errors holds the exception raised loading a service."""
+
+	def __init__(self):
+		self.services = {}
+		self.versions = {}
+		self.errors = {}
+
+	def add(self, service, version):
+		"""Add or replace a service with its loaded active version, or the exception raised loading it."""
+		self.services[service.id] = service
+		self.errors.pop(service.id, None)
+		self.versions.pop(service.id, None)
+		if isinstance(version, FastlyVersion):
+			self.versions[service.id] = version
+		elif isinstance(version, FastlyNoActiveVersionError):
+			self.versions[service.id] = None
+		elif version is not None:
+			self.errors[service.id] = version
+
+	def remove(self, service_id):
+		self.services.pop(service_id, None)
+		self.versions.pop(service_id, None)
+		self.errors.pop(service_id, None)
+
+	def components(self, name):
+		"""Yields (service_id, object) for every object of the named component across all active versions."""
+		for service_id, version in self.versions.items():
+			if version is not None:
+				for item in version._component(name).values():
+					yield (service_id, item)
+
+
+class FastlyInventoryIndex(object):
+	"""Lookup tables over the domains and backends of the active versions of an account's services, answering which services serve a hostname, including through wildcard domains, and which services use a backend address or any address within a CIDR network, without touching the API. Built from a FastlyInventory, refreshed incrementally and saved to a gzipped JSON file."""
+
+	def __init__(self):
+		self._services = {}
+		self._domains = {}
+		self._wildcards = {}
+		self._addresses = {}
+		self._networks = None
+
+	@classmethod
+	def from_inventory(cls, inventory):
+		index = cls()
+		for service_id, service in inventory.services.items():
+			index.update(service, inventory.versions.get(service_id))
+		return index
+
+	@classmethod
+	def load(cls, path):
+		index = cls()
+		f = gzip.open(path, "rb")
+		try:
+			data = json.loads(f.read())
+		finally:
+			f.close()
+		for service_id, entry in data["services"].items():
+			index._add(service_id, entry)
+		return index
+
+	def save(self, path):
+		data = json.dumps({"services": self._services}, separators=(",", ":"))
+		tmp = "%s.tmp" % path
+		f = gzip.open(tmp, "wb")
+		try:
+			f.write(data)
+		finally:
+			f.close()
+		os.rename(tmp, path)
+
+	def update(self, service, version):
+		"""Index, or re-index, a service with its active version, which may be None."""
+		self.remove(service.id)
+		entry = {
+			"name": service.name,
+			"version": None,
+			"domains": [],
+			"addresses": [],
+		}
+		if version is not None:
+			entry["version"] = int(version.number)
+			entry["domains"] = sorted(version._component("domains"))
+			entry["addresses"] = sorted(set([backend.address for backend in version._component("backends").values() if backend.address]))
+		self._add(service.id, entry)
+
+	def remove(self, service_id):
+		entry = self._services.pop(service_id, None)
+		if entry is None:
+			return
+		for domain in entry["domains"]:
+			self._discard(self._domain_table(domain), self._domain_key(domain), service_id)
+		for address in entry["addresses"]:
+			self._discard(self._addresses, address.lower(), service_id)
+		self._networks = None
+
+	def refresh(self, conn, parallelism=FASTLY_POOL_SIZE):
+		"""Bring the index up to date with one list_services call, loading only services that are new or whose active version changed, and dropping deleted ones. Returns the ids of the services re-indexed."""
+		services = conn.list_services()
+		current = set([service.id for service in services])
+		for service_id in set(self._services) - current:
+			self.remove(service_id)
+
+		stale = []
+		for service in services:
+			entry = self._services.get(service.id)
+			active = service._data.get("version")
+			if entry is None or entry["version"] != active or entry["name"] != service.name:
+				stale.append(service)
+		if stale:
+			inventory = conn.inventory(stale, parallelism)
+			for service_id, service in inventory.services.items():
+				if service_id not in inventory.errors:
+					self.update(service, inventory.versions.get(service_id))
+		return [service.id for service in stale]
+
+	def services_for_domain(self, hostname):
+		"""The ids of the services serving hostname, matching exact domains first and then wildcard domains from the most specific."""
+		hostname = hostname.lower().rstrip(".")
+		if hostname in self._domains:
+			return set(self._domains[hostname])
+		labels = hostname.split(".")
+		for i in range(1, len(labels)):
+			suffix = ".".join(labels[i:])
+			if suffix in self._wildcards:
+				return set(self._wildcards[suffix])
+		return set()
+
+	def services_for_address(self, address):
+		"""The ids of the services with a backend at address, an IP address or hostname, or at any IP address within address when it is a CIDR network such as 10.0.0.0/8."""
+		if "/" not in address:
+			return set(self._addresses.get(address.lower(), ()))
+		network, prefix = address.split("/", 1)
+		family, start = self._parse_ip(network)
+		bits = 32 if family == socket.AF_INET else 128
+		if family is None or not prefix.isdigit() or int(prefix) > bits:
+			raise FastlyError("Invalid network %s." % address)
+		size = 1 << (bits - int(prefix))
+		start -= start % size
+		networks = self._sorted_networks()
+		lower = bisect.bisect_left(networks, (family, start))
+		upper = bisect.bisect_left(networks, (family, start + size))
+		result = set()
+		for family, value, key in networks[lower:upper]:
+			result.update(self._addresses[key])
+		return result
+
+	def service_name(self, service_id):
+		entry = self._services.get(service_id)
+		return entry and entry["name"]
+
+	def _add(self, service_id, entry):
+		self._services[service_id] = entry
+		for domain in entry["domains"]:
+			self._domain_table(domain).setdefault(self._domain_key(domain), set()).add(service_id)
+		for address in entry["addresses"]:
+			self._addresses.setdefault(address.lower(), set()).add(service_id)
+		self._networks = None
+
+	def _discard(self, table, key, service_id):
+		ids = table.get(key)
+		if ids is not None:
+			ids.discard(service_id)
+			if not ids:
+				del table[key]
+
+	def _domain_table(self, domain):
+		return self._wildcards if domain.startswith("*.") else self._domains
+
+	def _domain_key(self, domain):
+		domain = domain.lower().rstrip(".")
+		return domain[2:] if domain.startswith("*.") else domain
+
+	def _sorted_networks(self):
+		# Rebuilt lazily after changes, then searched with bisect.
+		if self._networks is None:
+			networks = []
+			for key in self._addresses:
+				family, value = self._parse_ip(key)
+				if family is not None:
+					networks.append((family, value, key))
+			networks.sort()
+			self._networks = networks
+		return self._networks
+
+	def _parse_ip(self, address):
+		for family in (socket.AF_INET, socket.AF_INET6):
+			try:
+				packed = socket.inet_pton(family, address)
+			except (socket.error, ValueError):
+				continue
+			value = 0
+			for part in struct.unpack("!%dI" % (len(packed) / 4), packed):
+				value = (value << 32) | part
+			return (family, value)
+		return (None, None)
+
+
+# Maps each FastlyVersion component to the method listing it, its model, its key in the service details and its path under a version.
+FASTLY_VERSION_COMPONENTS = {
+	"backends": ("list_backends", FastlyBackend, "backends", "backend"),
+	"cache_settings": ("list_cache_settings", FastlyCacheSettings, "cache_settings", "cache_settings"),
+	"conditions": ("list_conditions", FastlyCondition, "conditions", "condition"),
+	"directors": ("list_directors", FastlyDirector, "directors", "director"),
+	"domains": ("list_domains", FastlyDomain, "domains", "domain"),
+	"gzips": ("list_gzip", FastlyGzip, "gzips", "gzip"),
+	"headers": ("list_headers", FastlyHeader, "headers", "header"),
+	"healthchecks": ("list_healthchecks", FastlyHealthCheck, "healthchecks", "healthcheck"),
+	"request_settings": ("list_request_settings", FastlyRequestSetting, "request_settings", "request_settings"),
+	"response_objects": ("list_response_objects", FastlyResponseObject, "response_objects", "response_object"),
+	"syslogs": ("list_syslogs", FastlySyslog, "syslogs", "syslog"),
+	"vcls": ("list_vcls", FastlyVCL, "vcls", "vcl"),
+	"wordpresses": ("list_wordpressess", FastlyWordpress, "wordpress", "wordpress"),
+}
+
+
+def log_request(method, path, status, latency, bytes_sent, bytes_received):
+	"""A request hook writing one structured line per request to the "fastly" logger."""
+	log.info("method=%s path=%s status=%s latency=%.3f sent=%d received=%d", method, path, status, latency, bytes_sent, bytes_received)
+
+
+def connect(api_key, username=None, password=None, **kwargs):
+	conn = FastlyConnection(api_key, **kwargs)
 	if username is not None and password is not None:
 		conn.login(username, password)
 	return conn
+
+
+def connect_async(api_key, username=None, password=None, **kwargs):
+	conn = AsyncFastlyConnection(api_key, **kwargs)
+	if username is not None and password is not None:
+		conn.login(username, password).result()
+	return conn
@@ -17,6 +17,10 @@ setup(
 	install_requires=[
 		'httplib2',
 	],
+	extras_require={
+		'stats': ['numpy'],
+		'http2': ['h2'],
+	},
 	scripts=['bin/fastly_upload_vcl.py', 'bin/fastly_purge_url.py'],
 	long_description=read('README.md'),
 	classifiers=[
@@ -0,0 +1,44 @@
+"""Wall time of inventory() as the number of workers grows, over the local stand-in API answering each service details request after a fixed latency.
+
+	python -m tests.bench_inventory [services] [latency_ms]
+"""
+
+import sys
+import time
+
+import fastly
+from tests.server import StandInServer, version_details
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+	latency = float(sys.argv[2] if len(sys.argv) > 2 else 20) / 1000
+
+	def details(request):
+		time.sleep(latency)
+		service_id = request.path.split("/")[2]
+		return (200, {}, {"id": service_id, "version": version_details(1, service_id)})
+
+	server = StandInServer()
+	server.routes[("GET", "/service")] = (200, {}, [{"id": "s%d" % i, "name": "s%d" % i} for i in range(count)])
+	server.routes["GET"] = details
+	server.start()
+	fastly.FASTLY_SCHEME = "http"
+	fastly.FASTLY_HOST = server.address
+	try:
+		for workers in [1, 2, 4, 8, 16, 32]:
+			conn = fastly.connect("api-key", pool_size=workers)
+			try:
+				services = conn.list_services()
+				start = time.time()
+				conn.inventory(services, parallelism=workers)
+				elapsed = time.time() - start
+			finally:
+				conn.close()
+			print "%2d workers  %6.3fs  %6.1f services/s" % (workers, elapsed, count / elapsed)
+	finally:
+		server.stop()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,67 @@
+"""Attribute access time and memory per object of the slotted models against the dict-backed FastlyObject they replaced.
+
+	python -m tests.bench_objects
+"""
+
+import sys
+import timeit
+
+import fastly
+
+
+class DictBackedObject(object):
+	"""FastlyObject as it was before the models were slotted."""
+
+	def __init__(self, conn, data):
+		self._conn = conn
+		self._data = data or {}
+
+	def __getattr__(self, name):
+		cls = self.__class__
+		if name in cls.FIELDS:
+			return self._data.get(name, None)
+		raise AttributeError()
+
+
+class DictBackedBackend(DictBackedObject):
+	FIELDS = fastly.FastlyBackend.FIELDS
+
+
+PAYLOAD = {
+	"name": "origin",
+	"address": "origin.example.com",
+	"port": 443,
+	"use_ssl": True,
+	"weight": 100,
+	"service_id": "s",
+	"version": 1,
+	"comment": "",
+	"shield": None,
+}
+
+
+def size(obj):
+	"""Bytes held by obj and its dicts, not counting the values they refer to."""
+	total = sys.getsizeof(obj)
+	attrs = getattr(obj, "__dict__", {})
+	if hasattr(obj, "__dict__"):
+		total += sys.getsizeof(attrs)
+	for value in attrs.values():
+		if isinstance(value, dict):
+			total += sys.getsizeof(value)
+	if isinstance(obj, fastly.FastlyObject) and isinstance(obj._extra, dict):
+		total += sys.getsizeof(obj._extra)
+	return total
+
+
+def main():
+	for name, cls in [("dict-backed", DictBackedBackend), ("slotted", fastly.FastlyBackend)]:
+		obj = cls(None, dict(PAYLOAD))
+		present = min(timeit.repeat(lambda: obj.address, number=1000000, repeat=3))
+		missing = min(timeit.repeat(lambda: obj.max_conn, number=1000000, repeat=3))
+		build = min(timeit.repeat(lambda: cls(None, dict(PAYLOAD)), number=100000, repeat=3))
+		print "%-12s present field %.0fns  missing field %.0fns  construct %.2fus  %d bytes per object" % (name, present * 1000, missing * 1000, build * 10, size(obj))
+
+
+if __name__ == "__main__":
+	main()
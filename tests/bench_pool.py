@@ -0,0 +1,56 @@
+"""Per-call latency of FastlyConnectionPool against a handle per call, as every request used before the pool, over the local stand-in API.
+
+	python -m tests.bench_pool [calls]
+"""
+
+import sys
+import time
+
+import httplib2
+
+import fastly
+from tests.server import StandInServer
+
+
+class HandlePerCallTransport(fastly.FastlyTransport):
+
+	def request(self, uri, method="GET", body=None, headers=None):
+		http = httplib2.Http(disable_ssl_certificate_validation=False, timeout=fastly.FASTLY_TIMEOUT)
+		try:
+			return http.request(uri, method, body=body, headers=headers)
+		finally:
+			for conn in http.connections.values():
+				conn.close()
+
+
+def measure(transport, calls):
+	conn = fastly.connect("api-key", transport=transport)
+	latencies = []
+	try:
+		for i in range(calls):
+			start = time.time()
+			conn.get_service("s")
+			latencies.append(time.time() - start)
+	finally:
+		conn.close()
+	latencies.sort()
+	return (latencies[len(latencies) / 2], latencies[int(len(latencies) * 0.99)])
+
+
+def main():
+	calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+	server = StandInServer()
+	server.routes[("GET", "/service/s")] = (200, {}, {"id": "s", "name": "n"})
+	server.start()
+	fastly.FASTLY_SCHEME = "http"
+	fastly.FASTLY_HOST = server.address
+	try:
+		for name, transport in [("handle per call", HandlePerCallTransport()), ("pool", fastly.FastlyConnectionPool())]:
+			median, p99 = measure(transport, calls)
+			print "%-16s median %.3fms  p99 %.3fms" % (name, median * 1000, p99 * 1000)
+	finally:
+		server.stop()
+
+
+if __name__ == "__main__":
+	main()
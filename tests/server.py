@@ -0,0 +1,238 @@
+import BaseHTTPServer
+import json
+import socket
+import SocketServer
+import threading
+import unittest
+
+import fastly
+
+try:
+	import h2.config
+	import h2.connection
+	import h2.events
+except ImportError:
+	h2 = None
+
+# A route answering RESET aborts the request without a response, resetting
+# the stream over HTTP/2 and dropping the connection over HTTP/1.1.
+RESET = object()
+
+
+def version_details(number, service_id="s", **components):
+	"""The version of a service details response, with every component empty unless given as a list."""
+	data = {"number": number, "service_id": service_id}
+	for key in ["backends", "cache_settings", "conditions", "directors", "domains", "gzips", "headers", "healthchecks", "request_settings", "response_objects", "syslogs", "vcls", "wordpress"]:
+		data[key] = list(components.get(key, ()))
+	return data
+
+
+class StandInRequest(object):
+	"""A request received by the stand-in API."""
+
+	def __init__(self, method, path, headers, body, client_address):
+		self.method = method
+		self.path = path
+		self.headers = headers
+		self.body = body
+		self.client_address = client_address
+
+
+class StandInServer(object):
+	"""A local stand-in for the Fastly API over HTTP/1.1. Routes map (method, path) or a bare method to a (status, headers, payload) tuple, or to a callable taking the StandInRequest and returning one. Unrouted requests answer {"status": "ok"}. A "Connection: close" response header closes the connection after the response."""
+
+	def __init__(self):
+		self.routes = {}
+		self.requests = []
+		self._lock = threading.Lock()
+		self._server = None
+
+	@property
+	def address(self):
+		return "127.0.0.1:%d" % self._server.server_address[1]
+
+	def start(self):
+		stand_in = self
+
+		class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+			protocol_version = "HTTP/1.1"
+			# Unbuffered writes leave a response stuck behind delayed ACKs.
+			wbufsize = -1
+
+			def log_message(self, *args):
+				pass
+
+			def handle_any(self):
+				length = int(self.headers.get("content-length") or 0)
+				body = self.rfile.read(length) if length else ""
+				headers = dict((k.lower(), v) for k, v in self.headers.items())
+				request = StandInRequest(self.command, self.path, headers, body, self.client_address)
+				response = stand_in.respond(request)
+				if response is RESET:
+					self.close_connection = 1
+					return
+				status, headers, data = response
+				self.send_response(status)
+				for name, value in headers.items():
+					self.send_header(name, value)
+				self.send_header("Content-Length", str(len(data)))
+				self.end_headers()
+				self.wfile.write(data)
+				self.wfile.flush()
+
+			do_GET = do_POST = do_PUT = do_DELETE = do_PURGE = handle_any
+
+		class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+			daemon_threads = True
+			request_queue_size = 128
+
+			def handle_error(self, request, client_address):
+				# Clients hanging up on slow routes are expected.
+				pass
+
+		self._server = Server(("127.0.0.1", 0), Handler)
+		thread = threading.Thread(target=self._server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+	def stop(self):
+		self._server.shutdown()
+		self._server.server_close()
+
+	def respond(self, request):
+		with self._lock:
+			self.requests.append(request)
+		route = self.routes.get((request.method, request.path.split("?")[0]), self.routes.get(request.method))
+		if callable(route):
+			route = route(request)
+		if route is None:
+			route = (200, {}, {"status": "ok"})
+		if route is RESET:
+			return RESET
+		status, headers, payload = route
+		data = payload if isinstance(payload, str) else json.dumps(payload)
+		return (status, headers, data)
+
+
+class StandInHTTP2Server(StandInServer):
+	"""The stand-in API over cleartext HTTP/2 with prior knowledge. A "Connection: close" response header sends GOAWAY after the response. Streams reset by the client are recorded in resets, and received data is only acknowledged while acknowledge_data is set."""
+
+	def __init__(self):
+		StandInServer.__init__(self)
+		self.resets = []
+		self.acknowledge_data = True
+		self._sock = None
+		self._clients = []
+
+	@property
+	def address(self):
+		return "127.0.0.1:%d" % self._sock.getsockname()[1]
+
+	def start(self):
+		self._sock = socket.socket()
+		self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._sock.bind(("127.0.0.1", 0))
+		self._sock.listen(128)
+		thread = threading.Thread(target=self._accept)
+		thread.daemon = True
+		thread.start()
+
+	def stop(self):
+		self._sock.close()
+		for sock in self._clients:
+			try:
+				sock.shutdown(socket.SHUT_RDWR)
+			except socket.error:
+				pass
+			sock.close()
+
+	def _accept(self):
+		while True:
+			try:
+				sock, client_address = self._sock.accept()
+			except socket.error:
+				return
+			self._clients.append(sock)
+			thread = threading.Thread(target=self._serve, args=(sock, client_address))
+			thread.daemon = True
+			thread.start()
+
+	def _serve(self, sock, client_address):
+		conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+		lock = threading.Lock()
+		pending = {}
+		with lock:
+			conn.initiate_connection()
+			sock.sendall(conn.data_to_send())
+		while True:
+			try:
+				data = sock.recv(65536)
+			except socket.error:
+				return
+			if not data:
+				return
+			with lock:
+				for event in conn.receive_data(data):
+					if isinstance(event, h2.events.RequestReceived):
+						pending[event.stream_id] = (event.headers, [])
+					elif isinstance(event, h2.events.DataReceived):
+						pending[event.stream_id][1].append(event.data)
+						if self.acknowledge_data:
+							conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+					elif isinstance(event, h2.events.StreamEnded):
+						headers, body = pending.pop(event.stream_id)
+						thread = threading.Thread(target=self._answer, args=(sock, conn, lock, event.stream_id, headers, "".join(body), client_address))
+						thread.daemon = True
+						thread.start()
+					elif isinstance(event, h2.events.StreamReset):
+						pending.pop(event.stream_id, None)
+						self.resets.append(event.stream_id)
+				sock.sendall(conn.data_to_send())
+
+	def _answer(self, sock, conn, lock, stream_id, headers, body, client_address):
+		pseudo = dict((k, v) for k, v in headers if k.startswith(":"))
+		headers = dict((k, v) for k, v in headers if not k.startswith(":"))
+		headers["host"] = pseudo[":authority"]
+		request = StandInRequest(pseudo[":method"], pseudo[":path"], headers, body, client_address)
+		response = self.respond(request)
+		with lock:
+			if stream_id in self.resets:
+				return
+			if response is RESET:
+				conn.reset_stream(stream_id)
+			else:
+				status, headers, data = response
+				headers = dict((k.lower(), v) for k, v in headers.items())
+				close = headers.pop("connection", None) == "close"
+				headers["content-length"] = str(len(data))
+				conn.send_headers(stream_id, [(":status", str(status))] + headers.items(), end_stream=not data)
+				if data:
+					conn.send_data(stream_id, data, end_stream=True)
+				if close:
+					conn.close_connection(last_stream_id=stream_id)
+			try:
+				sock.sendall(conn.data_to_send())
+			except socket.error:
+				pass
+
+
+class StandInTestCase(unittest.TestCase):
+	"""Points the fastly module at a fresh stand-in API for each test."""
+
+	server_class = StandInServer
+
+	def setUp(self):
+		self.server = self.server_class()
+		self.server.start()
+		self._endpoint = (fastly.FASTLY_SCHEME, fastly.FASTLY_HOST)
+		fastly.FASTLY_SCHEME = "http"
+		fastly.FASTLY_HOST = self.server.address
+
+	def tearDown(self):
+		fastly.FASTLY_SCHEME, fastly.FASTLY_HOST = self._endpoint
+		self.server.stop()
+
+	def connect(self, **kwargs):
+		conn = fastly.connect("api-key", **kwargs)
+		self.addCleanup(conn.close)
+		return conn
@@ -0,0 +1,86 @@
+import itertools
+import unittest
+
+import fastly
+from tests.server import StandInTestCase, version_details
+
+
+DESIRED = {
+	"conditions": [{"name": "cond", "statement": 'req.url ~ "^/api"', "type": "REQUEST"}],
+	"healthchecks": [{"name": "hc", "path": "/health"}],
+	"backends": [{"name": "api", "address": "api.example.com", "healthcheck": "hc", "request_condition": "cond"}],
+	"directors": [{"name": "pool", "backends": ["api"]}],
+}
+
+
+class ApplyTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		active = version_details(
+			1,
+			conditions=[{"name": "old_cond", "statement": "true", "type": "REQUEST"}],
+			backends=[{"name": "old", "address": "old.example.com", "request_condition": "old_cond"}],
+			directors=[{"name": "old_pool", "backends": ["old"]}],
+		)
+		self.server.routes[("GET", "/service/s/details")] = (200, {}, {"id": "s", "version": active})
+		self.server.routes[("PUT", "/service/s/version/1/clone")] = (200, {}, {"number": 2, "service_id": "s"})
+
+	def writes(self):
+		prefix = "/service/s/version/2/"
+		return [(request.method, request.path[len(prefix):]) for request in self.server.requests if request.method != "GET" and request.path.startswith(prefix)]
+
+	def test_plan(self):
+		conn = self.connect()
+		version, steps = conn.plan("s", DESIRED)
+		self.assertEqual(version.number, 1)
+		stages = [sorted((step["action"], step["component"], step["name"]) for step in group) for stage, group in itertools.groupby(steps, conn._apply_stage)]
+		self.assertEqual(stages, [
+			[("delete", "directors", "old_pool")],
+			[("create", "conditions", "cond"), ("create", "healthchecks", "hc")],
+			[("create", "backends", "api")],
+			[("create", "directors", "pool")],
+			[("attach", "directors", "pool")],
+			[("delete", "backends", "old")],
+			[("delete", "conditions", "old_cond")],
+		])
+
+	def test_stage_order(self):
+		version = self.connect().apply("s", DESIRED)
+		self.assertEqual(version.number, 2)
+		stages = [
+			[("DELETE", "director/old_pool")],
+			[("POST", "condition"), ("POST", "healthcheck")],
+			[("POST", "backend")],
+			[("POST", "director")],
+			[("POST", "director/pool/backend/api")],
+			[("DELETE", "backend/old")],
+			[("DELETE", "condition/old_cond")],
+		]
+		writes = self.writes()
+		self.assertEqual(sorted(writes), sorted(sum(stages, [])))
+		for i, stage in enumerate(stages):
+			self.assertEqual(sorted(writes[:len(stage)]), sorted(stage), "stage %d" % i)
+			writes = writes[len(stage):]
+
+	def test_nothing_to_apply(self):
+		desired = {"backends": [{"name": "old", "address": "old.example.com"}]}
+		self.assertEqual(self.connect().apply("s", desired).number, 1)
+		self.assertEqual(self.writes(), [])
+
+	def test_failed_stage(self):
+		self.server.routes[("POST", "/service/s/version/2/condition")] = (400, {}, {"msg": "Bad condition", "detail": "syntax"})
+		self.server.routes[("POST", "/service/s/version/2/healthcheck")] = (400, {}, {"msg": "Bad healthcheck", "detail": "path"})
+		try:
+			self.connect().apply("s", DESIRED)
+		except fastly.FastlyApplyError as e:
+			self.assertEqual(e.version_number, 2)
+			self.assertEqual(sorted(step["name"] for step, error in e.errors), ["cond", "hc"])
+			self.assertTrue(all(isinstance(error, fastly.FastlyError) for step, error in e.errors))
+		else:
+			self.fail("apply did not raise")
+		self.assertNotIn(("POST", "backend"), self.writes())
+
+
+if __name__ == "__main__":
+	unittest.main()
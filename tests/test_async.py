@@ -0,0 +1,37 @@
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class AsyncConnectionTest(StandInTestCase):
+
+	def connect_async(self, **kwargs):
+		conn = fastly.connect_async("api-key", **kwargs)
+		self.addCleanup(conn.close)
+		return conn
+
+	def test_methods_return_futures(self):
+		self.server.routes[("GET", "/service/s")] = (200, {}, {"id": "s", "name": "n"})
+		conn = self.connect_async()
+		future = conn.get_service("s")
+		self.assertIsInstance(future, fastly.FastlyFuture)
+		self.assertEqual(future.result(5).name, "n")
+		self.assertEqual(conn.get_service.__doc__, fastly.FastlyConnection.get_service.__doc__)
+
+	def test_concurrent_calls(self):
+		conn = self.connect_async(concurrency=8)
+		futures = [conn.get_service("s%d" % i) for i in range(8)]
+		self.assertEqual(len([future.result(5) for future in futures]), 8)
+
+	def test_properties_are_not_wrapped(self):
+		conn = self.connect_async()
+		self.assertRaises(AttributeError, getattr, conn, "purge_queue")
+		self.assertRaises(AttributeError, getattr, conn, "stats")
+		self.assertIsNone(conn.connection._purge_queue)
+		self.assertRaises(AttributeError, getattr, conn, "_fetch")
+		self.assertRaises(AttributeError, getattr, conn, "no_such_method")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class ResponseCacheTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.server.routes[("GET", "/service/s/version/2")] = (200, {}, {"number": 2, "service_id": "s", "active": True})
+
+	def fetches(self):
+		return len([request for request in self.server.requests if request.path == "/service/s/version/2"])
+
+	def test_activation_invalidates_other_versions(self):
+		conn = self.connect(cache=fastly.FastlyResponseCache())
+		conn.get_version("s", 2)
+		conn.activate_version("s", 3)
+		conn.get_version("s", 2)
+		self.assertEqual(self.fetches(), 2)
+
+	def test_version_write_keeps_other_versions(self):
+		conn = self.connect(cache=fastly.FastlyResponseCache())
+		conn.get_version("s", 2)
+		conn.update_backend("s", 3, "origin", port=443)
+		conn.get_version("s", 2)
+		self.assertEqual(self.fetches(), 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import fastly
+from tests.server import StandInTestCase, version_details
+
+
+class InventoryTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.delays = {}
+		self.server.routes[("GET", "/service")] = (200, {}, [{"id": "slow", "name": "slow"}, {"id": "a", "name": "a"}, {"id": "b", "name": "b"}, {"id": "none", "name": "none"}])
+		self.server.routes["GET"] = self.details
+
+	def details(self, request):
+		service_id = request.path.split("/")[2]
+		time.sleep(self.delays.get(service_id, 0))
+		if service_id == "none":
+			return (200, {}, {"id": service_id, "version": {}})
+		if service_id == "broken":
+			return (500, {}, {"msg": "boom"})
+		return (200, {}, {"id": service_id, "version": version_details(3, service_id, domains=[{"name": "%s.com" % service_id}])})
+
+	def test_inventory(self):
+		inventory = self.connect().inventory()
+		self.assertEqual(sorted(inventory.services), ["a", "b", "none", "slow"])
+		self.assertEqual(inventory.versions["none"], None)
+		self.assertEqual(sorted((service_id, domain.name) for service_id, domain in inventory.components("domains")), [("a", "a.com"), ("b", "b.com"), ("slow", "slow.com")])
+		self.assertEqual(inventory.errors, {})
+
+	def test_no_active_version(self):
+		conn = self.connect()
+		self.assertRaises(fastly.FastlyNoActiveVersionError, conn.get_version_snapshot, "none")
+		inventory = fastly.FastlyInventory()
+		inventory.add(conn.get_service("a"), fastly.FastlyError("Service a has no active version."))
+		self.assertEqual(sorted(inventory.errors), ["a"])
+
+	def test_errors(self):
+		inventory = self.connect().inventory(["a", "broken"])
+		self.assertEqual(sorted(inventory.errors), ["broken"])
+		self.assertEqual(sorted(inventory.versions), ["a"])
+
+	def test_progress_in_completion_order(self):
+		self.delays["slow"] = 0.5
+		reports = []
+		self.connect().inventory(progress=lambda done, total, service_id: reports.append((done, total, service_id)))
+		self.assertEqual([(done, total) for done, total, service_id in reports], [(1, 4), (2, 4), (3, 4), (4, 4)])
+		self.assertEqual(reports[-1][2], "slow")
+
+
+class InventoryIndexTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.services = {
+			"a": (1, ["www.a.com", "*.a.com"], ["10.1.2.3", "origin.a.com"]),
+			"b": (4, ["*.shop.a.com", "b.org"], ["10.1.9.9", "2001:db8::1"]),
+			"none": (None, [], []),
+		}
+		self.server.routes[("GET", "/service")] = lambda request: (200, {}, [{"id": service_id, "name": service_id, "version": number} for service_id, (number, domains, addresses) in sorted(self.services.items())])
+		self.server.routes["GET"] = self.details
+
+	def details(self, request):
+		service_id = request.path.split("/")[2]
+		number, domains, addresses = self.services[service_id]
+		if number is None:
+			return (200, {}, {"id": service_id, "version": {}})
+		return (200, {}, {"id": service_id, "version": version_details(number, service_id, domains=[{"name": domain} for domain in domains], backends=[{"name": "b%d" % i, "address": address} for i, address in enumerate(addresses)])})
+
+	def build(self):
+		conn = self.connect()
+		return (conn, fastly.FastlyInventoryIndex.from_inventory(conn.inventory()))
+
+	def test_domains(self):
+		conn, index = self.build()
+		self.assertEqual(index.services_for_domain("www.a.com"), set(["a"]))
+		self.assertEqual(index.services_for_domain("img.a.com"), set(["a"]))
+		self.assertEqual(index.services_for_domain("x.shop.a.com"), set(["b"]))
+		self.assertEqual(index.services_for_domain("B.ORG."), set(["b"]))
+		self.assertEqual(index.services_for_domain("a.com"), set())
+
+	def test_addresses(self):
+		conn, index = self.build()
+		self.assertEqual(index.services_for_address("ORIGIN.a.com"), set(["a"]))
+		self.assertEqual(index.services_for_address("10.1.2.3"), set(["a"]))
+		self.assertEqual(index.services_for_address("10.1.0.0/16"), set(["a", "b"]))
+		self.assertEqual(index.services_for_address("10.1.2.0/24"), set(["a"]))
+		self.assertEqual(index.services_for_address("2001:db8::/32"), set(["b"]))
+		self.assertEqual(index.services_for_address("192.168.0.0/16"), set())
+
+	def test_invalid_networks(self):
+		conn, index = self.build()
+		self.assertEqual(index.services_for_address("10.1.2.3/32"), set(["a"]))
+		self.assertEqual(index.services_for_address("0.0.0.0/0"), set(["a", "b"]))
+		for address in ["10.0.0.0/40", "10.0.0.0/x", "10.0.0.0/-1", "2001:db8::/129", "10.0.0/8"]:
+			self.assertRaises(fastly.FastlyError, index.services_for_address, address)
+
+	def test_save_and_load(self):
+		conn, index = self.build()
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory)
+		path = os.path.join(directory, "index.gz")
+		index.save(path)
+		loaded = fastly.FastlyInventoryIndex.load(path)
+		self.assertEqual(loaded.services_for_domain("img.a.com"), set(["a"]))
+		self.assertEqual(loaded.services_for_address("10.0.0.0/8"), set(["a", "b"]))
+
+	def test_refresh(self):
+		conn, index = self.build()
+		self.assertEqual(index.refresh(conn), [])
+		self.services["b"] = (5, ["b.net"], [])
+		del self.services["a"]
+		self.assertEqual(index.refresh(conn), ["b"])
+		self.assertEqual(index.services_for_domain("b.org"), set())
+		self.assertEqual(index.services_for_domain("b.net"), set(["b"]))
+		self.assertEqual(index.services_for_domain("www.a.com"), set())
+		self.assertEqual(index.services_for_address("10.0.0.0/8"), set())
+
+
+if __name__ == "__main__":
+	unittest.main()
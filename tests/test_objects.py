@@ -0,0 +1,59 @@
+import unittest
+
+import fastly
+
+
+class StubConnection(object):
+
+	def __init__(self):
+		self.calls = []
+
+	def get_healthcheck(self, service_id, version_number, name):
+		self.calls.append((service_id, version_number, name))
+		return name
+
+
+class FastlyObjectTest(unittest.TestCase):
+
+	def test_fields_are_slots(self):
+		backend = fastly.FastlyBackend(None, {"name": "origin", "port": 80})
+		self.assertIn("name", fastly.FastlyBackend.__slots__)
+		self.assertFalse(hasattr(backend, "__dict__"))
+		self.assertEqual(backend.name, "origin")
+		self.assertEqual(backend.port, 80)
+
+	def test_missing_field_is_none(self):
+		backend = fastly.FastlyBackend(None, {"name": "origin"})
+		self.assertIsNone(backend.address)
+		self.assertRaises(AttributeError, getattr, backend, "no_such_field")
+
+	def test_extra_keys(self):
+		backend = fastly.FastlyBackend(None, {"name": "origin", "shield": "iad"})
+		self.assertEqual(backend.shield, "iad")
+		self.assertEqual(backend._data, {"name": "origin", "shield": "iad"})
+
+	def test_shadowed_field(self):
+		conn = StubConnection()
+		backend = fastly.FastlyBackend(conn, {"name": "origin", "service_id": "s", "version": 2, "healthcheck": "hc"})
+		self.assertEqual(backend.healthcheck, "hc")
+		self.assertEqual(conn.calls, [("s", 2, "hc")])
+		self.assertEqual(backend._data["healthcheck"], "hc")
+		self.assertIsNone(fastly.FastlyBackend(conn, {"name": "origin"}).healthcheck)
+
+	def test_data_round_trip(self):
+		payload = {"name": "origin", "port": 80, "healthcheck": "hc", "shield": None}
+		self.assertEqual(fastly.FastlyBackend(None, payload)._data, payload)
+		self.assertEqual(fastly.FastlyBackend(None, None)._data, {})
+
+	def test_list_payload(self):
+		payload = [{"name": "www.example.com"}, "global.prod.fastly.net", True]
+		check = fastly.FastlyDomainCheck(None, payload)
+		self.assertEqual(check._data, payload)
+		self.assertEqual(check.domain.name, "www.example.com")
+		self.assertEqual(check.cname, "global.prod.fastly.net")
+		self.assertTrue(check.success)
+		self.assertEqual(repr(check), repr(payload))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,56 @@
+import time
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+
+	def time_acquires(self, limiter, count):
+		start = time.time()
+		for i in range(count):
+			limiter.acquire()
+		return time.time() - start
+
+	def test_unpaced_until_updated(self):
+		self.assertLess(self.time_acquires(fastly.FastlyAdaptiveRateLimiter(), 50), 0.1)
+
+	def test_full_speed_above_reserve(self):
+		limiter = fastly.FastlyAdaptiveRateLimiter(reserve=100)
+		limiter.update(999, time.time() + 3600)
+		self.assertLess(self.time_acquires(limiter, 500), 0.1)
+
+	def test_paced_within_reserve(self):
+		limiter = fastly.FastlyAdaptiveRateLimiter(reserve=10)
+		limiter.update(12, time.time() + 2)
+		# Two requests above the reserve, then 6 per second.
+		self.assertLess(self.time_acquires(limiter, 2), 0.1)
+		self.assertGreater(self.time_acquires(limiter, 3), 0.4)
+
+
+class ConnectionRateLimitTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		reset = str(int(time.time()) + 3600)
+		self.server.routes["PUT"] = (200, {"Fastly-RateLimit-Remaining": "0", "Fastly-RateLimit-Reset": reset}, {"status": "ok"})
+
+	def test_no_pacing_by_default(self):
+		conn = self.connect()
+		self.assertIsNone(conn.rate_limiter)
+		start = time.time()
+		for i in range(5):
+			conn.update_service("s", name="n")
+		self.assertLess(time.time() - start, 1)
+
+	def test_limiter_follows_headers(self):
+		limiter = fastly.FastlyAdaptiveRateLimiter()
+		conn = self.connect(rate_limiter=limiter)
+		conn.update_service("s", name="n")
+		self.assertAlmostEqual(limiter.rate, 1 / 3600.0, places=5)
+		self.assertEqual(limiter._tokens, 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
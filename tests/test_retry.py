@@ -0,0 +1,33 @@
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class RetryPolicyTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.server.routes["PUT"] = (503, {}, {"msg": "unavailable"})
+
+	def connect_retrying(self, **kwargs):
+		return self.connect(retry_policy=fastly.FastlyRetryPolicy(backoff=0.01, **kwargs))
+
+	def test_idempotent_put_is_retried(self):
+		conn = self.connect_retrying()
+		self.assertRaises(fastly.FastlyError, conn.update_service, "s", name="n")
+		self.assertEqual(len(self.server.requests), 4)
+
+	def test_clone_is_not_retried(self):
+		conn = self.connect_retrying()
+		self.assertRaises(fastly.FastlyError, conn.clone_version, "s", 1)
+		self.assertEqual(len(self.server.requests), 1)
+
+	def test_clone_is_retried_when_opted_in(self):
+		conn = self.connect_retrying(retry_clone=True)
+		self.assertRaises(fastly.FastlyError, conn.clone_version, "s", 1)
+		self.assertEqual(len(self.server.requests), 4)
+
+
+if __name__ == "__main__":
+	unittest.main()
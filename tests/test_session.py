@@ -0,0 +1,59 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class SessionStoreTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "session")
+		self.session = "fastly.session=first"
+		self.server.routes[("POST", "/login")] = lambda request: (200, {"Set-Cookie": "%s; Path=/" % self.session}, {"user": "u"})
+		self.server.routes[("GET", "/service")] = lambda request: (200, {}, []) if request.headers.get("cookie") == self.session else (401, {}, {"msg": "Unauthorized"})
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+		StandInTestCase.tearDown(self)
+
+	def login(self, user="u"):
+		conn = self.connect(session_store=fastly.FastlySessionStore(self.path))
+		conn.login(user, "password")
+		return conn
+
+	def paths(self):
+		return [request.path for request in self.server.requests]
+
+	def test_session_is_stored_privately(self):
+		self.login().list_services()
+		self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0600)
+		self.assertEqual(self.paths(), ["/login", "/service"])
+
+	def test_session_is_reused(self):
+		self.login()
+		self.login().list_services()
+		self.assertEqual(self.paths(), ["/login", "/service"])
+
+	def test_session_of_another_user_is_not_reused(self):
+		self.login()
+		self.login("other")
+		self.assertEqual(self.paths(), ["/login", "/login"])
+
+	def test_rejected_session_logs_in_again(self):
+		self.login()
+		self.session = "fastly.session=second"
+		conn = self.login()
+		self.assertEqual(conn.list_services(), [])
+		self.assertEqual(self.paths(), ["/login", "/service", "/login", "/service"])
+		self.assertEqual(conn.stats.get("failures", 0), 0)
+		self.assertEqual(fastly.FastlySessionStore(self.path).load("u")[0], "fastly.session=second")
+
+
+if __name__ == "__main__":
+	unittest.main()
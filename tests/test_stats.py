@@ -0,0 +1,44 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class StatsStoreTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+		self.samples = []
+		self.server.routes[("GET", "/service/s/stats/minutely")] = lambda request: (200, {}, {"data": self.samples})
+
+	def fetches(self):
+		return len([request for request in self.server.requests if "/stats/" in request.path])
+
+	def test_settled_range_is_fetched_once(self):
+		store = fastly.FastlyStatsStore(self.connect(), self.directory, settle=0)
+		end = int(time.time()) - 3600
+		start = end - 600
+		self.samples = [{"start_time": start + 60 * i, "requests": i} for i in range(10)]
+		store.query("s", fastly.FastlyStatsType.MINUTELY, start, end)
+		stats = store.query("s", fastly.FastlyStatsType.MINUTELY, start, end)
+		self.assertEqual(self.fetches(), 1)
+		self.assertEqual(len(stats.timestamps), 10)
+
+	def test_delayed_samples_are_fetched_later(self):
+		store = fastly.FastlyStatsStore(self.connect(), self.directory, settle=600)
+		now = int(time.time())
+		start = now - now % 60 - 300
+		self.assertEqual(len(store.query("s", fastly.FastlyStatsType.MINUTELY, start, now).timestamps), 0)
+		self.samples = [{"start_time": start + 60 * i, "requests": i} for i in range(5)]
+		stats = store.query("s", fastly.FastlyStatsType.MINUTELY, start, now)
+		self.assertEqual(self.fetches(), 2)
+		self.assertEqual(len(stats.timestamps), 5)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class IterArrayTest(unittest.TestCase):
+
+	def decode(self, content):
+		return list(fastly.FastlyConnection("api-key")._iter_array(content))
+
+	def test_valid(self):
+		self.assertEqual(self.decode("[]"), [])
+		self.assertEqual(self.decode(" [ ]\n"), [])
+		self.assertEqual(self.decode('[1, {"a": [2, 3]} ,"x"]'), [1, {"a": [2, 3]}, "x"])
+
+	def test_malformed(self):
+		for content in ["[1,,2]", "[1 2]", "[1,]", "[,1]", "[1]x", "{}", ""]:
+			self.assertRaises(fastly.FastlyError, self.decode, content)
+
+	def test_truncated(self):
+		items = fastly.FastlyConnection("api-key")._iter_array('[1, {"a": 2}, {"b"')
+		self.assertEqual(next(items), 1)
+		self.assertEqual(next(items), {"a": 2})
+		self.assertRaises(fastly.FastlyError, next, items)
+
+
+class IterServicesTest(StandInTestCase):
+
+	def test_iter_services(self):
+		self.server.routes[("GET", "/service")] = (200, {}, [{"id": "a", "name": "one"}, {"id": "b", "name": "two"}])
+		self.assertEqual([service.name for service in self.connect().iter_services()], ["one", "two"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,148 @@
+import httplib
+import socket
+import time
+import unittest
+
+import httplib2
+
+import fastly
+from tests.server import RESET, StandInHTTP2Server, StandInTestCase
+
+
+def slow(delay, response=(200, {}, {"status": "ok"})):
+	def route(request):
+		time.sleep(delay)
+		return response
+	return route
+
+
+class TransportTests(object):
+	"""Tests every transport passes against the stand-in API."""
+
+	max_sockets = None
+
+	def make_transport(self, timeout=fastly.FASTLY_TIMEOUT):
+		raise NotImplementedError()
+
+	def transport(self, **kwargs):
+		transport = self.make_transport(**kwargs)
+		self.addCleanup(transport.close)
+		return transport
+
+	def url(self, path):
+		return "http://%s%s" % (self.server.address, path)
+
+	def sockets(self):
+		return set(request.client_address for request in self.server.requests)
+
+	def test_request(self):
+		self.server.routes[("GET", "/service")] = (200, {"Set-Cookie": "fastly.session=abc; Path=/"}, [{"id": "s"}])
+		resp, content = self.transport().request(self.url("/service?x=1"), "GET", headers={"Fastly-Key": "k"})
+		self.assertEqual(resp.status, 200)
+		self.assertEqual(resp["set-cookie"], "fastly.session=abc; Path=/")
+		self.assertEqual(content, '[{"id": "s"}]')
+		self.assertEqual(self.server.requests[0].path, "/service?x=1")
+		self.assertEqual(self.server.requests[0].headers["fastly-key"], "k")
+
+	def test_error_status_is_returned(self):
+		self.server.routes[("GET", "/service/missing")] = (404, {}, {"msg": "Record not found"})
+		resp, content = self.transport().request(self.url("/service/missing"))
+		self.assertEqual(resp.status, 404)
+
+	def test_concurrent_requests(self):
+		self.server.routes[("GET", "/service")] = slow(0.2)
+		transport = self.transport()
+		workers = fastly.FastlyWorkerPool(16)
+		self.addCleanup(workers.shutdown)
+		start = time.time()
+		futures = [workers.submit(transport.request, self.url("/service")) for i in range(16)]
+		statuses = [future.result()[0].status for future in futures]
+		self.assertEqual(statuses, [200] * 16)
+		self.assertLess(time.time() - start, 16 * 0.2 / 2)
+		self.assertLessEqual(len(self.sockets()), self.max_sockets)
+
+	def test_body_larger_than_flow_control_window(self):
+		body = "x" * 300000
+		resp, content = self.transport().request(self.url("/service/s/version/1/vcl/main"), "PUT", body=body)
+		self.assertEqual(resp.status, 200)
+		self.assertEqual(self.server.requests[0].body, body)
+
+	def test_timeout(self):
+		self.server.routes[("GET", "/slow")] = slow(1.5)
+		transport = self.transport(timeout=0.5)
+		self.assertRaises(socket.timeout, transport.request, self.url("/slow"))
+		resp, content = transport.request(self.url("/service"))
+		self.assertEqual(resp.status, 200)
+
+	def test_reset(self):
+		self.server.routes[("GET", "/reset")] = RESET
+		transport = self.transport()
+		self.assertRaises((socket.error, httplib.HTTPException), transport.request, self.url("/reset"))
+		resp, content = transport.request(self.url("/service"))
+		self.assertEqual(resp.status, 200)
+
+	def test_server_closing_connection(self):
+		self.server.routes[("GET", "/close")] = (200, {"Connection": "close"}, {"status": "ok"})
+		transport = self.transport()
+		resp, content = transport.request(self.url("/close"))
+		self.assertEqual(resp.status, 200)
+		resp, content = transport.request(self.url("/service"))
+		self.assertEqual(resp.status, 200)
+		self.assertEqual(len(self.sockets()), 2)
+
+	def test_connection(self):
+		self.server.routes[("GET", "/service")] = (200, {}, [{"id": "s", "name": "n"}])
+		conn = self.connect(transport=self.transport())
+		self.assertEqual([service.id for service in conn.list_services()], ["s"])
+
+
+class ConnectionPoolTest(TransportTests, StandInTestCase):
+
+	# Each concurrent request needs a handle of its own.
+	max_sockets = 16
+
+	def make_transport(self, timeout=fastly.FASTLY_TIMEOUT):
+		return fastly.FastlyConnectionPool(16, timeout)
+
+	def test_handle_that_raised_is_closed(self):
+		self.server.routes[("GET", "/garbled")] = (200, {"Content-Encoding": "gzip"}, "not gzip")
+		transport = self.transport()
+		transport.request(self.url("/service"))
+		http = transport._idle.queue[-1]
+		self.assertRaises(httplib2.FailedToDecompressContent, transport.request, self.url("/garbled"))
+		self.assertTrue(transport._idle.empty())
+		self.assertTrue(all(conn.sock is None for conn in http.connections.values()))
+
+
+@unittest.skipIf(fastly.h2 is None, "requires the h2 package")
+class HTTP2TransportTest(TransportTests, StandInTestCase):
+
+	server_class = StandInHTTP2Server
+	max_sockets = 1
+
+	def make_transport(self, timeout=fastly.FASTLY_TIMEOUT):
+		return fastly.FastlyHTTP2Transport(timeout=timeout)
+
+	def wait_for_reset(self):
+		deadline = time.time() + 2
+		while not self.server.resets and time.time() < deadline:
+			time.sleep(0.01)
+		return self.server.resets
+
+	def test_timeout_resets_stream(self):
+		self.server.routes[("GET", "/slow")] = slow(1.5)
+		transport = self.transport(timeout=0.5)
+		self.assertRaises(socket.timeout, transport.request, self.url("/slow"))
+		self.assertEqual(self.wait_for_reset(), [1])
+
+	def test_flow_control_stall_times_out(self):
+		self.server.acknowledge_data = False
+		transport = self.transport(timeout=0.5)
+		self.assertRaises(socket.timeout, transport.request, self.url("/service/s/version/1/vcl/main"), "PUT", body="x" * 300000)
+		self.assertEqual(self.wait_for_reset(), [1])
+		for conn in transport._connections.values():
+			self.assertEqual(conn._streams, {})
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+import fastly
+from tests.server import StandInTestCase
+
+
+class ValidatorCacheTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.server.routes["GET"] = self.respond
+
+	def respond(self, request):
+		if request.headers.get("if-none-match") == '"v1"':
+			return (304, {"ETag": '"v1"'}, "")
+		return (200, {"ETag": '"v1"'}, {"id": request.path.split("/")[2], "name": "n"})
+
+	def test_disabled_by_default(self):
+		conn = self.connect()
+		conn.get_service("a")
+		conn.get_service("a")
+		self.assertEqual([request.headers.get("if-none-match") for request in self.server.requests], [None, None])
+		self.assertNotIn("conditional_hits", conn.stats)
+
+	def test_revalidation(self):
+		conn = self.connect(validators=fastly.FastlyValidatorCache())
+		self.assertEqual(conn.get_service("a").id, "a")
+		self.assertEqual(conn.get_service("a").id, "a")
+		self.assertEqual([request.headers.get("if-none-match") for request in self.server.requests], [None, '"v1"'])
+		self.assertEqual(conn.stats["conditional_hits"], 1)
+
+	def test_max_entries(self):
+		conn = self.connect(validators=fastly.FastlyValidatorCache(max_entries=1))
+		conn.get_service("a")
+		conn.get_service("b")
+		conn.get_service("a")
+		self.assertEqual([request.headers.get("if-none-match") for request in self.server.requests], [None, None, None])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import fastly
+from tests.server import StandInTestCase, version_details
+
+
+class DiffVersionsTest(StandInTestCase):
+
+	def route_versions(self, versions):
+		def details(request):
+			number = int(request.path.split("version=")[1])
+			return (200, {}, {"id": "s", "version": versions[number]})
+		self.server.routes[("GET", "/service/s/details")] = details
+
+	def test_response_object_content_is_compared(self):
+		self.route_versions({
+			1: version_details(1, response_objects=[{"name": "ro", "status": "200", "content": "body-1"}]),
+			2: version_details(2, response_objects=[{"name": "ro", "status": "200", "content": "body-2"}]),
+		})
+		diff = self.connect().diff_versions("s", 1, 2)
+		self.assertEqual(diff, {"response_objects": {
+			"added": {},
+			"removed": {},
+			"changed": {"ro": {"content": ("body-1", "body-2")}},
+		}})
+
+	def test_vcl_content_is_compared_by_md5(self):
+		self.route_versions({
+			1: version_details(1, vcls=[{"name": "main", "md5": "aaa", "content": "sub vcl_recv {}"}]),
+			2: version_details(2, vcls=[{"name": "main", "md5": "aaa", "content": "sub vcl_recv { }"}]),
+		})
+		self.assertEqual(self.connect().diff_versions("s", 1, 2), {})
+
+	def test_vcl_content_is_downloaded_when_md5_differs(self):
+		self.route_versions({
+			1: version_details(1, vcls=[{"name": "main", "md5": "aaa"}]),
+			2: version_details(2, vcls=[{"name": "main", "md5": "bbb"}]),
+		})
+		self.server.routes[("GET", "/service/s/version/1/vcl/main")] = (200, {}, {"name": "main", "md5": "aaa", "content": "one"})
+		self.server.routes[("GET", "/service/s/version/2/vcl/main")] = (200, {}, {"name": "main", "md5": "bbb", "content": "two"})
+		diff = self.connect().diff_versions("s", 1, 2)
+		self.assertEqual(diff["vcls"]["changed"], {"main": {"md5": ("aaa", "bbb"), "content": ("one", "two")}})
+
+
+class VersionSnapshotTest(StandInTestCase):
+
+	def setUp(self):
+		StandInTestCase.setUp(self)
+		self.pools = []
+		pool_class = fastly.FastlyWorkerPool
+		def make_pool(workers=fastly.FASTLY_POOL_SIZE, backlog=0):
+			self.pools.append(workers)
+			return pool_class(workers, backlog)
+		fastly.FastlyWorkerPool = make_pool
+		self.addCleanup(setattr, fastly, "FastlyWorkerPool", pool_class)
+
+	def route_details(self, *missing):
+		data = version_details(1)
+		for key in missing:
+			del data[key]
+		self.server.routes[("GET", "/service/s/details")] = (200, {}, {"id": "s", "version": data})
+		self.server.routes[("GET", "/service/s/version/1/syslog")] = (200, {}, [{"name": "log"}])
+
+	def test_single_missing_component_is_fetched_inline(self):
+		self.route_details("syslogs")
+		version = self.connect().get_version_snapshot("s", parallelism=8)
+		self.assertEqual(self.pools, [])
+		self.assertEqual(version._component("syslogs").keys(), ["log"])
+
+	def test_pool_is_sized_to_missing_components(self):
+		self.route_details("syslogs", "gzips")
+		self.connect().get_version_snapshot("s", parallelism=8)
+		self.assertEqual(self.pools, [2])
+
+
+if __name__ == "__main__":
+	unittest.main()